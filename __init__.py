@@ -9,8 +9,14 @@ if __name__ == '__main__':
     import unittest
 
     # unit tests
+    import test_batch
+    import test_client
+    import test_index
+    import test_mirror
+    import test_pack
     import test_parser
     import test_ranking
+    import test_utils
 
     # integration tests
     import test_plugin
@@ -18,8 +24,14 @@ if __name__ == '__main__':
 
     def get_unit_suites():
         test_loader = unittest.TestLoader()
-        return [test_loader.loadTestsFromModule(test_parser),
-                test_loader.loadTestsFromModule(test_ranking)]
+        return [test_loader.loadTestsFromModule(test_batch),
+                test_loader.loadTestsFromModule(test_client),
+                test_loader.loadTestsFromModule(test_index),
+                test_loader.loadTestsFromModule(test_mirror),
+                test_loader.loadTestsFromModule(test_pack),
+                test_loader.loadTestsFromModule(test_parser),
+                test_loader.loadTestsFromModule(test_ranking),
+                test_loader.loadTestsFromModule(test_utils)]
 
 
     def get_integration_suites():
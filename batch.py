@@ -0,0 +1,382 @@
+"""
+calibre_plugins.comicvine - A calibre metadata source for comicvine
+
+Identify many titles in one job, sharing lookups between titles.
+"""
+from collections import OrderedDict
+from functools import partial
+import json
+import multiprocessing
+import os
+from Queue import Queue
+import time
+
+from client import (get_request_count, reset_client, share_token_bucket,
+                    SharedBucketState)
+from config import PREFS
+import parser
+import ranking
+import utils
+
+
+class BatchInput(object):
+    """One title to identify, parsed from a line of batch input."""
+
+    def __init__(self, index, line):
+        self.index = index
+        self.line = line
+        (expected_id, separator, title) = line.partition('|')
+        if separator and expected_id.strip().isdigit():
+            self.expected_id = expected_id.strip()
+            self.title = title
+        else:
+            self.expected_id = None
+            self.title = line
+
+
+def can_fork_processes():
+    """Return whether multiprocessing starts its processes by forking."""
+    get_start_method = getattr(multiprocessing, 'get_start_method', None)
+    if get_start_method is not None:
+        return get_start_method() == 'fork'
+    return hasattr(os, 'fork')
+
+
+def read_batch_inputs(lines):
+    """
+    Parse batch input lines, in either 'id|title' format (as used by
+    test/passing_titles.txt) or as bare titles. Blank lines are skipped.
+    """
+    inputs = []
+    for line in lines:
+        if isinstance(line, str):
+            line = line.decode('utf-8')
+        line = line.rstrip('\r\n')
+        if line.strip():
+            inputs.append(BatchInput(len(inputs), line))
+    return inputs
+
+
+def group_batch_inputs(inputs, tokenizer):
+    """
+    Group inputs by their normalised title tokens, in order of first
+    appearance, so that each distinct volume search runs once.
+    """
+    groups = OrderedDict()
+    for batch_input in inputs:
+        title_tokens = parser.get_title_tokens(batch_input.title, tokenizer)
+        groups.setdefault(tuple(title_tokens), []).append(batch_input)
+    return groups
+
+
+class BatchJournal(object):
+    """
+    Append-only checkpoint journal of a batch job, in JSON lines.
+
+    Records when each input is started and finished, with its result and
+    the number of requests it took, so that a restarted job can skip
+    finished inputs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.finished = {}
+        self.started = set()
+        self.request_times = []
+        if os.path.exists(path):
+            with open(path) as journal_file:
+                for line in journal_file:
+                    self.replay(line)
+        self.journal_file = open(path, 'a')
+
+    def replay(self, line):
+        """Restore state from one journal line."""
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # the last line may be incomplete if the job was killed
+            return
+        if entry['event'] == 'started':
+            self.started.add(entry['input'])
+        elif entry['event'] == 'finished':
+            self.started.discard(entry['input'])
+            self.finished[entry['input']] = entry['result']
+            self.request_times.append((entry['time'], entry['requests']))
+
+    def is_finished(self, batch_input):
+        """True if the input was finished by this or an earlier run."""
+        return batch_input.line in self.finished
+
+    def is_in_flight(self, batch_input):
+        """True if an earlier run started the input but did not finish it."""
+        return batch_input.line in self.started
+
+    def start(self, batch_input):
+        """Record that work on the input has started."""
+        self.started.add(batch_input.line)
+        self.write({'event': 'started', 'input': batch_input.line})
+
+    def finish(self, batch_input, result, requests):
+        """Record the result of the input, and the requests it took."""
+        now = time.time()
+        self.started.discard(batch_input.line)
+        self.finished[batch_input.line] = result
+        self.request_times.append((now, requests))
+        self.write({'event': 'finished', 'input': batch_input.line,
+                    'result': result, 'requests': requests, 'time': now})
+
+    def get_requests_since(self, since):
+        """Count requests recorded by inputs finished after since."""
+        return sum(requests for (finish_time, requests) in self.request_times
+                   if finish_time >= since)
+
+    def write(self, entry):
+        """Append an entry, making sure it reaches the disk."""
+        self.journal_file.write(json.dumps(entry) + '\n')
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+
+    def close(self):
+        """Close the journal file."""
+        self.journal_file.close()
+
+
+class BatchProgress(object):
+    """
+    Track throughput of a batch job, and estimate when it will finish
+    given the request rate limit and the remaining hourly request quota.
+    """
+
+    def __init__(self, remaining, journal=None):
+        self.remaining = remaining
+        self.journal = journal
+        self.completed = 0
+        self.requests = 0
+        self.start_time = time.time()
+
+    def update(self, requests):
+        """Record one more completed input, which took requests."""
+        self.completed += 1
+        self.remaining -= 1
+        self.requests += requests
+
+    def get_quota_left(self):
+        """Estimate the requests left in the hourly quota."""
+        quota = PREFS['hourly_request_quota']
+        if self.journal is None:
+            used = self.requests
+        else:
+            used = self.journal.get_requests_since(time.time() - 3600)
+        return max(quota - used, 0)
+
+    def get_eta(self):
+        """
+        Estimate the seconds until the job finishes: the slower of the
+        observed throughput and the rate and quota limits.
+        """
+        if not self.completed:
+            return None
+        elapsed = time.time() - self.start_time
+        throughput_eta = elapsed / self.completed * self.remaining
+
+        needed = float(self.requests) / self.completed * self.remaining
+        rate_eta = needed * PREFS['request_interval']
+        over_quota = needed - self.get_quota_left()
+        if over_quota > 0:
+            quota = max(PREFS['hourly_request_quota'], 1)
+            rate_eta = max(rate_eta, 3600 * (1 + int(over_quota // quota)))
+
+        return max(throughput_eta, rate_eta)
+
+    def format(self):
+        """Format a one-line progress report."""
+        elapsed = max(time.time() - self.start_time, 1e-6)
+        eta = self.get_eta()
+        return ('%d done, %d remaining, %.1f titles/minute, '
+                '%.1f requests/title, %d requests left in hourly quota, '
+                'ETA %s' % (
+                    self.completed, self.remaining,
+                    self.completed * 60.0 / elapsed,
+                    float(self.requests) / max(self.completed, 1),
+                    self.get_quota_left(),
+                    'unknown' if eta is None else '%ds' % eta))
+
+
+class BatchIdentifier(object):
+    """
+    Identify batches of titles with a Comicvine source plugin.
+
+    Titles with the same title tokens share a single volume search, and
+    the issue index of each candidate volume is fetched once per batch.
+
+    With more than one process, groups of titles are identified in a
+    process pool. The processes share the file cache and one request
+    budget, and results are still written in input order.
+    """
+
+    def __init__(self, plugin, log, journal=None, processes=1):
+        self.plugin = plugin
+        self.log = log
+        self.journal = journal
+        if processes > 1 and not can_fork_processes():
+            # the plugin, log and shared bucket are inherited by forking,
+            # and cannot be pickled for spawned processes
+            log.warning('Cannot fork processes on this platform, '
+                        'identifying in a single process')
+            processes = 1
+        self.processes = processes
+
+    def run(self, inputs, output):
+        """
+        Identify every input, writing one JSON line per input to output,
+        in input order, as soon as its best match is known.
+
+        With a journal, inputs finished by an earlier run are written from
+        the journal without any lookups.
+        """
+        journal = self.journal
+        ready = {}
+        pending = []
+        for batch_input in inputs:
+            if journal is not None and journal.is_finished(batch_input):
+                ready[batch_input.index] = journal.finished[batch_input.line]
+            else:
+                pending.append(batch_input)
+
+        next_index = 0
+        while next_index in ready:
+            write_result(output, ready.pop(next_index))
+            next_index += 1
+
+        progress = BatchProgress(len(pending), journal)
+        groups = group_batch_inputs(pending, self.plugin.get_title_tokens)
+        for group_results in self.identify_groups(groups):
+            for batch_input, result, requests in group_results:
+                if journal is not None:
+                    journal.finish(batch_input, result, requests)
+                ready[batch_input.index] = result
+                progress.update(requests)
+            self.log.info(progress.format())
+
+            while next_index in ready:
+                write_result(output, ready.pop(next_index))
+                next_index += 1
+
+    def identify_groups(self, groups):
+        """
+        Identify each group of inputs, in this process or a process pool.
+
+        Yields the results of each group, as returned by identify_group,
+        in order of completion.
+        """
+        if self.processes > 1:
+            for group_inputs in groups.values():
+                self.start_group(group_inputs)
+            pool = multiprocessing.Pool(self.processes,
+                                        initializer=init_batch_worker,
+                                        initargs=(self.plugin, self.log,
+                                                  SharedBucketState()))
+            try:
+                for group_results in pool.imap_unordered(identify_batch_group,
+                                                         groups.items()):
+                    yield group_results
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for title_tokens, group_inputs in groups.items():
+                self.start_group(group_inputs)
+                yield self.identify_group(title_tokens, group_inputs)
+
+    def start_group(self, group_inputs):
+        """Record in the journal that work on the inputs has started."""
+        if self.journal is None:
+            return
+        for batch_input in group_inputs:
+            if self.journal.is_in_flight(batch_input):
+                self.log.info('Resuming: %s' % batch_input.line)
+            self.journal.start(batch_input)
+
+    def identify_group(self, title_tokens, group_inputs):
+        """
+        Identify a group of inputs which share title tokens.
+
+        Returns a list of (input, result, requests) tuples, where requests
+        counts the comicvine requests made for the input. The group's
+        volume search is counted against its first input.
+        """
+        group_results = []
+        requests = get_request_count()
+        candidate_volumes = utils.find_volumes(list(title_tokens), self.log)
+        issue_index = utils.find_volume_issue_numbers(
+            [volume.id for volume in candidate_volumes], self.log)
+        for batch_input in group_inputs:
+            result = self.identify(batch_input, issue_index)
+            request_count = get_request_count()
+            group_results.append((batch_input, result,
+                                  request_count - requests))
+            requests = request_count
+        return group_results
+
+    def identify(self, batch_input, issue_index):
+        """
+        Find the best match for one input among the indexed volumes.
+
+        Returns a JSON-serializable dict describing the input and match.
+        """
+        title = batch_input.title
+        issue_number = parser.get_issue_number(title)
+        issue_ids = parser.find_indexed_issue_ids(issue_index, issue_number)
+
+        query = ranking.QueryContext(title=title,
+                                     tokenizer=self.plugin.get_title_tokens)
+        rank = partial(ranking.keygen, query=query)
+        detail_ids = self.plugin.select_detail_ids(self.log, issue_ids, rank)
+        results = self.plugin.enqueue_all(self.log, Queue(), detail_ids,
+                                          self.plugin.get_ranker(query))
+
+        output = {
+            'index': batch_input.index,
+            'input': batch_input.line,
+            'expected': batch_input.expected_id,
+            'candidates': len(issue_ids),
+            'comicvine': None,
+        }
+        if results:
+            best = ranking.best_results(results, query, 1)[0]
+            scorer = ranking.IssueScorer(metadata=best, query=query)
+            output.update({
+                'comicvine': best.identifiers['comicvine'],
+                'comicvine-volume': best.identifiers.get('comicvine-volume'),
+                'title': best.title,
+                'score': rank(best),
+                'breakdown': scorer.score_breakdown(),
+            })
+        return output
+
+
+# state of a batch worker process, see init_batch_worker
+_worker = {}
+
+
+def init_batch_worker(plugin, log, shared_bucket_state):
+    """
+    Initialise a batch worker process to identify groups for the plugin,
+    sharing the request budget of the other processes.
+    """
+    reset_client()
+    share_token_bucket(shared_bucket_state)
+    _worker['identifier'] = BatchIdentifier(plugin, log)
+
+
+def identify_batch_group(group):
+    """Identify a (title tokens, inputs) group in a batch worker process."""
+    title_tokens, group_inputs = group
+    return _worker['identifier'].identify_group(title_tokens, group_inputs)
+
+
+def write_result(output, result):
+    """Write one batch result as a JSON line."""
+    output.write(json.dumps(result) + '\n')
+    output.flush()
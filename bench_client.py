@@ -0,0 +1,70 @@
+"""
+Microbenchmark of building a client.Issue from a pycomicvine Issue, as
+parsed from a detailed issue lookup. Needs calibre's python, but no
+network access. Run with: calibre-debug -e bench_client.py
+"""
+import timeit
+
+import pycomicvine
+
+import client
+
+REPEAT = 2000
+
+# the resource types the issue fields convert to, as listed by Comicvine
+RESOURCE_TYPES = [
+    (4000, 'issue', 'issues'),
+    (4040, 'person', 'people'),
+    (4010, 'publisher', 'publishers'),
+    (4050, 'volume', 'volumes'),
+]
+
+ISSUE_FIELDS = {
+    'name': u'The Barkening',
+    'issue_number': u'2',
+    'description': u'<p>Rex and Fido face the barkening.</p>' * 20,
+    'person_credits': [{'id': 40000 + i, 'name': u'Person %d' % i,
+                        'role': u'writer'} for i in range(8)],
+    'volume': {'id': 18059, 'name': u'Dogville',
+               'publisher': {'id': 10, 'name': u'Dog Comics'}},
+    'image': {'super_url': u'http://example.com/super.jpg',
+              'medium_url': u'http://example.com/medium.jpg',
+              'small_url': u'http://example.com/small.jpg'},
+    'store_date': None,
+    'cover_date': u'2000-01-02',
+}
+
+
+def load_resource_types():
+    """Fill in pycomicvine's resource types, instead of requesting them."""
+    types = object.__new__(pycomicvine.Types)
+    types._mapping = {}
+    for type_id, detail_name, list_name in RESOURCE_TYPES:
+        resource_type = {
+            'id': type_id,
+            'detail_resource_name': detail_name,
+            'list_resource_name': list_name,
+            'singular_resource_class': getattr(
+                pycomicvine, pycomicvine.Types._camilify_type_name(detail_name)),
+        }
+        types._mapping[detail_name] = resource_type
+        types._mapping[list_name] = resource_type
+    types._ready = True
+    pycomicvine.Types._instance = types
+
+
+def build_issue():
+    pycomicvine._cached_resources.clear()
+    comicvine_issue = pycomicvine.Issue(1, do_not_download=True,
+                                        **ISSUE_FIELDS)
+    return client.Issue(comicvine_issue)
+
+
+def report(name, function):
+    seconds = min(timeit.repeat(function, number=REPEAT, repeat=3))
+    print('%-10s %8.2f us/issue' % (name, seconds / REPEAT * 1e6))
+
+
+if __name__ == '__main__':
+    load_resource_types()
+    report('issue', build_issue)
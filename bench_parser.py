@@ -0,0 +1,78 @@
+"""
+Microbenchmark of title parsing, per title, with and without the cache
+of parsed titles, and of the worst cases of the regex parser against the
+linear-time parser. Run with: python bench_parser.py
+"""
+import timeit
+
+import parser
+
+TITLES = [
+    'Magnus, Robot Fighter 01 (2010) (two covers) (Minutemen-DTs)',
+    'Spider-Man 003.1 (2010) (extra stuff)',
+    'Buffy Season 10 015 (2015) (Digital) (Cypher 2.0-Empire)',
+    'Jughead #210 (2016) (Jojo)',
+    '100 Bullets v02 - Split Second Chance (2001) (Zone-Empire)',
+    "'68 Bad Sign OS (2015)",
+    'Superman #01\xbd',
+    'A-Force 008(2016)',
+]
+
+REPEAT = 2000
+
+
+def tokenizer(title):
+    return title.split()
+
+
+def parse_all():
+    for title in TITLES:
+        parser.get_title_tokens(title, tokenizer)
+        parser.get_issue_number(title)
+        parser.get_year(title)
+
+
+def parse_all_uncached():
+    for title in TITLES:
+        parser.parse_normalised_title(title, tokenizer)
+        parser.parse_normalised_title(title)
+        parser.parse_year(title)
+
+
+def parse_all_regex():
+    for title in TITLES:
+        parser.parse_normalised_title_regex(title, tokenizer)
+        parser.parse_normalised_title_regex(title)
+        parser.parse_year(title)
+
+
+def report(name, function):
+    seconds = min(timeit.repeat(function, number=REPEAT, repeat=3))
+    print('%-10s %8.2f us/title' %
+          (name, seconds / REPEAT / len(TITLES) * 1e6))
+
+
+# titles on which the regex parser backtracks, by length
+WORST_CASES = [
+    ('long title before two numbers', lambda length: 'x' * length + '1 2'),
+    ('unclosed parentheses', lambda length: '(' * length),
+]
+
+
+def report_worst_cases():
+    for name, make_title in WORST_CASES:
+        for length in (500, 1000, 2000, 4000):
+            title = make_title(length)
+            for parse in (parser.parse_normalised_title_regex,
+                          parser.parse_normalised_title):
+                seconds = min(timeit.repeat(lambda: parse(title),
+                                            number=1, repeat=3))
+                print('%-30s %5d %-30s %8.2f ms' %
+                      (name, length, parse.__name__, seconds * 1e3))
+
+
+if __name__ == '__main__':
+    report('regex', parse_all_regex)
+    report('uncached', parse_all_uncached)
+    report('cached', parse_all)
+    report_worst_cases()
@@ -1,11 +1,17 @@
 """
 calibre_plugins.comicvine - A calibre metadata source for comicvine
 """
+from collections import namedtuple
+import itertools
 import logging
+import multiprocessing
 import random
+import re
 import time
 import threading
 import os
+from Queue import Full, Queue
+from urllib import urlencode, quote_plus
 from urllib2 import HTTPError
 
 import pyfscache
@@ -13,6 +19,11 @@ import pycomicvine
 from pycomicvine.error import RateLimitExceededError, InvalidResourceError
 
 from config import PREFS
+from index import get_name_tokens, VolumeIndex
+import parser
+from mirror import ComicvineMirror
+from ranking import score_collection
+from pack import CachePack, get_pack_key, PackError, write_pack
 
 # private bucket state - only access or modify this via RLock'ed TokenBucket
 _bucket_state = {
@@ -21,12 +32,34 @@ _bucket_state = {
 }
 
 
+class SharedBucketState(object):
+    """
+    Token bucket state in shared memory, so that several processes can
+    share one request budget.
+
+    Create it before starting the processes, then pass it to
+    share_token_bucket in each process.
+    """
+    keys = ('tokens', 'update')
+
+    def __init__(self):
+        self.values = multiprocessing.Array('d', [0, time.time()], lock=False)
+        self.lock = multiprocessing.RLock()
+
+    def __getitem__(self, key):
+        return self.values[self.keys.index(key)]
+
+    def __setitem__(self, key, value):
+        self.values[self.keys.index(key)] = value
+
+
 class TokenBucket(object):
     """Class to hand out tokens to allow calls to comicvine."""
 
     def __init__(self):
         """Give the instance a re-entrant lock."""
         self.lock = threading.RLock()
+        self.consumed = 0
 
     def consume(self):
         """Acquire a token from a pool of max tokens."""
@@ -41,6 +74,24 @@ class TokenBucket(object):
                 logging.warning('%0.2f seconds to next request token', delay)
                 time.sleep(delay)
             _bucket_state['tokens'] -= 1
+            self.consumed += 1
+
+    def try_consume(self, reserve=0):
+        """
+        Acquire a token without waiting, only if more than reserve tokens
+        are available. Returns whether a token was acquired.
+        """
+        if not self.lock.acquire(False):
+            # another thread is consuming or waiting for a token
+            return False
+        try:
+            if self.tokens < reserve + 1:
+                return False
+            _bucket_state['tokens'] -= 1
+            self.consumed += 1
+            return True
+        finally:
+            self.lock.release()
 
     @property
     def tokens(self):
@@ -66,6 +117,32 @@ class TokenBucket(object):
 _token_bucket = TokenBucket()
 
 
+def share_token_bucket(shared_state):
+    """
+    Take tokens from a SharedBucketState, sharing the request budget with
+    other processes using the same state.
+    """
+    global _bucket_state
+    with _token_bucket.lock:
+        _bucket_state = shared_state
+        _token_bucket.lock = shared_state.lock
+
+
+class NoSpareTokenError(Exception):
+    """Raised for background requests when no spare token is available."""
+    pass
+
+
+# requests made by the current thread only use spare tokens, keeping
+# 'reserve' tokens for foreground requests, see NeighborPrefetcher
+_background_requests = threading.local()
+
+
+def get_request_count():
+    """Return the number of comicvine requests made by this process."""
+    return _token_bucket.consumed
+
+
 def retry_on_comicvine_error(max_attempts):
     """
     Decorator for functions that access the comicvine api.
@@ -121,7 +198,11 @@ def retry_on_comicvine_error(max_attempts):
                 )
 
             for attempt in range(1, max_attempts + 1):
-                _token_bucket.consume()
+                reserve = getattr(_background_requests, 'reserve', None)
+                if reserve is None:
+                    _token_bucket.consume()
+                elif not _token_bucket.try_consume(reserve):
+                    raise NoSpareTokenError()
 
                 try:
                     return target_function(*args, **kwargs)
@@ -160,34 +241,43 @@ def retry_on_comicvine_error(max_attempts):
     return wrap_function
 
 
-def cache_comicvine(name, **kwargs):
+def cache_comicvine(name, key_builder, **kwargs):
     """
     Decorator for instance methods on the comicvine wrapper.
+
+    The key_builder is called with the method arguments, excluding 'self',
+    and must return a canonical, versioned key, so that logically identical
+    calls share a cache entry.
     """
 
     cache_path = get_cache_path(name, hours=PREFS['cache_hours'], **kwargs)
 
     if cache_path is not None:
+        pack_name = get_pack_name(cache_path)
+
         def wrap_function(target_function):
             """Wrap the target function."""
 
             cache_it = pyfscache.FSCache(cache_path, hours=PREFS['cache_hours'])
 
-            def instance_function(*args, **kwargs):
-                """
-                Wrap the instance function to pop the 'self' instance off
-                the arguments list.
-                """
-                self = args[0]
-
-                @cache_it
-                def cached_function(*args, **kwargs):
-                    """Wrap the actual function to cache its return value."""
-                    return target_function(self, *args, **kwargs)
-
-                return cached_function(*args[1:], **kwargs)
-
-            return instance_function
+            def keyer(self, *args, **kwargs):
+                """Build the cache key, ignoring the 'self' instance."""
+                return (name,) + key_builder(*args, **kwargs)
+
+            def packed_function(self, *args, **kwargs):
+                """Look in the cache pack before calling the function."""
+                found, value = get_packed_value(
+                    pack_name, keyer(self, *args, **kwargs))
+                if found:
+                    return value
+                return target_function(self, *args, **kwargs)
+
+            cached_function = pyfscache.cache_function(packed_function,
+                                                       keyer, cache_it)
+            cached_function.cache = cache_it
+            cached_function.keyer = keyer
+            cached_function.pack_name = pack_name
+            return cached_function
 
         return wrap_function
     else:
@@ -198,6 +288,99 @@ def cache_comicvine(name, **kwargs):
         return wrap_function
 
 
+def get_lookup_key(entity_id):
+    """
+    Version 1 cache key for entity lookups: the ID as a plain int.
+    """
+    return 1, int(entity_id)
+
+
+def get_issue_search_key(volume_ids, issue_number):
+    """
+    Version 1 cache key for issue searches: sorted, de-duplicated volume
+    IDs and the issue number as text.
+    """
+    if issue_number is not None:
+        issue_number = to_unicode(issue_number)
+    return 1, tuple(sorted(set(int(id) for id in volume_ids))), issue_number
+
+
+def get_volume_search_key(title_tokens):
+    """
+    Version 1 cache key for volume searches: sorted, de-duplicated and
+    lower-cased title tokens, as unicode.
+    """
+    return 1, tuple(sorted(set(to_unicode(token).lower()
+                               for token in title_tokens)))
+
+
+def get_name_search_key(title_tokens):
+    """
+    Version 1 cache key for recorded volume searches: the sorted,
+    de-duplicated name tokens of the title tokens, so that names spelt or
+    punctuated otherwise share a key.
+    """
+    return 1, tuple(sorted(set(get_name_tokens(
+        u' '.join(to_unicode(token) for token in title_tokens)))))
+
+
+def to_unicode(text):
+    """
+    Return text as unicode, decoding byte strings as UTF-8, so that e.g.
+    tokens of command line arguments share cache keys with those of
+    calibre's unicode titles.
+    """
+    if isinstance(text, str):
+        return text.decode('utf-8')
+    return unicode(text)
+
+
+class ResultCache(object):
+    """
+    File-system cache for results derived from other cached calls.
+
+    Each entry carries its own expiration, so it can be invalidated as
+    soon as the first of the entries it was derived from expires.
+    """
+
+    def __init__(self, name, hours):
+        self.name = name
+        cache_path = get_cache_path(name, hours=hours)
+        if cache_path is not None:
+            self.cache = pyfscache.FSCache(cache_path, hours=hours)
+        else:
+            self.cache = None
+
+    def get(self, key):
+        """
+        Return the unexpired value cached for key, or None. Values not in
+        the file cache are looked for in the cache pack.
+        """
+        if self.cache is None:
+            return None
+        if key in self.cache:
+            expiration, value = self.cache[key]
+            if expiration is None or expiration >= time.time():
+                return value
+            self.cache.expire(key)
+        found, entry = get_packed_value(self.name, key)
+        if found:
+            expiration, value = entry
+            if expiration is None or expiration >= time.time():
+                return value
+        return None
+
+    def put(self, key, value, expiration):
+        """Cache value for key until the given expiration."""
+        if self.cache is None:
+            return
+        try:
+            self.cache[key] = (expiration, value)
+        except pyfscache.CacheError:
+            # another thread stored the same result first
+            pass
+
+
 def get_cache_path(name, hours, **kwargs):
     """
     Get the file path to the cache for the cache name and args.
@@ -215,15 +398,118 @@ def get_cache_path(name, hours, **kwargs):
         return None
 
 
-ISSUE_FIELDS = ['id',
-                'name',
-                'volume',
-                'issue_number',
-                'person_credits',
-                'description',
-                'store_date',
-                'cover_date',
-                'image']
+def get_pack_name(cache_path):
+    """
+    Get the name of a cache in a cache pack, from its cache path: the cache
+    name and args, without the cache hours.
+    """
+    return re.sub(r'-hours-[^-]+', '', os.path.basename(cache_path), count=1)
+
+
+# the open cache pack, see get_cache_pack
+_cache_pack = {
+    'path': None,
+    'pack': None,
+}
+_cache_pack_lock = threading.Lock()
+
+
+def get_cache_pack():
+    """
+    Return the configured cache pack, or None. The pack is opened once,
+    and reopened whenever the configured path changes.
+    """
+    path = PREFS['cache_pack_path']
+    if path != _cache_pack['path']:
+        with _cache_pack_lock:
+            if path != _cache_pack['path']:
+                pack = None
+                if path:
+                    try:
+                        pack = CachePack(path)
+                    except (IOError, PackError) as error:
+                        logging.getLogger(__name__).warning(
+                            'Ignoring cache pack: %s' % error)
+                _cache_pack['pack'] = pack
+                _cache_pack['path'] = path
+    return _cache_pack['pack']
+
+
+def get_packed_value(pack_name, key):
+    """
+    Return (True, value) if the cache pack has an unexpired value for the
+    key of the named cache, or (False, None).
+    """
+    pack = get_cache_pack()
+    if pack is None:
+        return False, None
+    return pack.get(get_pack_key(pack_name, pyfscache.make_digest(key)))
+
+
+def build_cache_pack(path, mirror=None):
+    """
+    Write every unexpired entry of the file cache to a cache pack, and
+    every volume and issue of the mirror, if given, as cached lookups
+    that never expire. File cache entries take precedence.
+
+    Returns the number of entries written.
+    """
+    return write_pack(path, itertools.chain(iter_cache_entries(),
+                                            iter_mirror_entries(mirror)))
+
+
+def iter_cache_entries():
+    """
+    Iterate over the (pack key, expiration, value) entries of every
+    unexpired value in the file cache.
+    """
+    cache_root = get_cache_root()
+    if cache_root is None:
+        return
+    for cache_name in sorted(os.listdir(cache_root)):
+        pack_name = get_pack_name(cache_name)
+        for digest, contents in iter_cache_contents(
+                os.path.join(cache_root, cache_name)):
+            if not contents.expired():
+                yield (get_pack_key(pack_name, digest), contents.expiration,
+                       contents.value)
+
+
+def iter_mirror_entries(mirror):
+    """
+    Iterate over the (pack key, expiration, value) entries of the lookups
+    answered by the mirror's volumes and issues.
+    """
+    if mirror is None:
+        return
+
+    def get_lookup_pack_key(name, entity_id):
+        return get_pack_key(name, pyfscache.make_digest(
+            (name,) + get_lookup_key(entity_id)))
+
+    for record in mirror.get_volumes():
+        yield (get_lookup_pack_key('lookup_volume', record['id']), None,
+               Volume.from_record(record))
+    for record in mirror.get_issues():
+        issue = Issue.from_record(record)
+        if issue.has_details:
+            yield (get_lookup_pack_key('lookup_issue', issue.id), None, issue)
+        yield (get_lookup_pack_key('lookup_issue_summary', issue.id), None,
+               issue)
+
+
+# fields needed to rank candidate issues
+ISSUE_SUMMARY_FIELDS = ['id',
+                        'name',
+                        'volume',
+                        'issue_number',
+                        'store_date',
+                        'cover_date',
+                        'image']
+
+# all fields, including the larger description and credits
+ISSUE_FIELDS = ISSUE_SUMMARY_FIELDS + ['person_credits',
+                                       'description']
 
 VOLUME_FIELDS = ['id',
                  'name',
@@ -231,26 +517,219 @@ VOLUME_FIELDS = ['id',
                  'publisher']
 
 
+ClientSettings = namedtuple('ClientSettings', ['api_key',
+                                               'cache_hours',
+                                               'max_attempts',
+                                               'max_url_length',
+                                               'search_volume_limit',
+                                               'mirror_path',
+                                               'local_volume_search',
+                                               'prefetch_neighbors'])
+
+
+# trigram similarity of a volume name to the title, above which the volume
+# is taken as a match without searching comicvine
+CONFIDENT_SIMILARITY = 0.9
+# trigram similarity above which a volume is a candidate, when the
+# comicvine search finds nothing
+CANDIDATE_SIMILARITY = 0.5
+
+# resources per page of a list request, the most Comicvine allows
+LIST_PAGE_SIZE = 100
+
+# issues waiting for their neighbors to be prefetched, beyond which more
+# are dropped
+PREFETCH_QUEUE_SIZE = 16
+
+# name of the mirror watermark of the last sync
+SYNC_WATERMARK = 'date_last_updated'
+SYNC_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# seconds by which each sync window overlaps the previous one
+SYNC_OVERLAP = 24 * 3600
+
+
+def read_settings():
+    """
+    Take an immutable snapshot of the client configuration from PREFS.
+    """
+    return ClientSettings(api_key=PREFS['api_key'],
+                          cache_hours=PREFS['cache_hours'],
+                          max_attempts=PREFS['retries'],
+                          max_url_length=PREFS['max_url_length'],
+                          search_volume_limit=PREFS['search_volume_limit'],
+                          mirror_path=PREFS['mirror_path'],
+                          local_volume_search=PREFS['local_volume_search'],
+                          prefetch_neighbors=PREFS['prefetch_neighbors'])
+
+
+# private shared client state - only access or modify this via get_client
+_shared_client = {
+    'client': None,
+}
+_shared_client_lock = threading.Lock()
+
+# log used by the shared client, injected per thread by get_client
+_client_log = threading.local()
+
+
+def get_client(log):
+    """
+    Return the process-wide comicvine client, logging to the given log.
+
+    The client is rebuilt whenever the configuration changes; the new
+    instance replaces the old one atomically, so threads still using the
+    old client are unaffected.
+    """
+    settings = read_settings()
+    client = _shared_client['client']
+    if client is None or client.settings != settings:
+        with _shared_client_lock:
+            client = _shared_client['client']
+            if client is None or client.settings != settings:
+                client = PyComicvineWrapper(settings)
+                _shared_client['client'] = client
+    _client_log.log = log
+    return client
+
+
+def reset_client():
+    """
+    Forget the process-wide client, so that the next get_client call
+    builds a new one. Used in new processes, which must not share the
+    database connection of their parent's client.
+    """
+    with _shared_client_lock:
+        _shared_client['client'] = None
+
+
+# issue IDs and numbers of each volume, see find_volume_issue_numbers
+_volume_issue_numbers = ResultCache('volume_issue_numbers',
+                                    hours=PREFS['cache_hours'])
+
+# when each name was last searched for on comicvine, see search_for_volumes
+_volume_searches = ResultCache('volume_searches', hours=PREFS['cache_hours'])
+
+
 class PyComicvineWrapper(object):
     """
     Wrapper for calls to Comicvine, via the pycomicvine API.
 
     Adds retry logic, internal rate limiting, and file-system caching.
+
+    Instances are immutable and shared between threads; use get_client
+    rather than constructing one directly.
     """
 
-    def __init__(self, log):
-        self.log = log
-        self.cache_hours = PREFS['cache_hours']
-        self.max_attempts = PREFS['retries']
-        self.issue_search_page_size = PREFS['issue_search_page_size']
-        self.search_volume_limit = PREFS['search_volume_limit']
-        pycomicvine.api_key = PREFS['api_key']
+    def __init__(self, settings):
+        self.settings = settings
+        self.cache_hours = settings.cache_hours
+        self.max_attempts = settings.max_attempts
+        self.max_url_length = settings.max_url_length
+        self.search_volume_limit = settings.search_volume_limit
+        if settings.mirror_path:
+            self.mirror = ComicvineMirror(settings.mirror_path)
+        else:
+            self.mirror = None
+        self.local_volume_search = settings.local_volume_search
+        # index of every volume seen, built on first use by get_volume_index
+        self.volume_index = None
+        self.volume_index_lock = threading.Lock()
+        if settings.prefetch_neighbors:
+            self.prefetcher = NeighborPrefetcher(self,
+                                                 settings.prefetch_neighbors)
+        else:
+            self.prefetcher = None
+        # pycomicvine only supports a module-level key, so it is set once
+        # per configuration rather than once per query
+        pycomicvine.api_key = settings.api_key
+        # fields missing from a response read as None, rather than being
+        # requested by pycomicvine, bypassing the retries and rate limit
+        pycomicvine.strict_fields = True
+
+    @property
+    def log(self):
+        """The log injected for the current thread by get_client."""
+        return getattr(_client_log, 'log', None) or logging.getLogger(__name__)
+
+    def get_cache_expiration(self, method_name, *args):
+        """
+        Return when the cached result of calling the named method with args
+        expires, or None if it never expires.
+
+        Raises KeyError if the call is not cached.
+        """
+        method = getattr(type(self), method_name).im_func
+        if not hasattr(method, 'cache'):
+            # caching is disabled, nothing can expire
+            return None
+        return method.cache.get_item_expiration(method.keyer(self, *args))
 
-    @cache_comicvine('lookup_volume')
+    def is_cached(self, method_name, *args):
+        """
+        Return whether the result of calling the named method with args is
+        in the file cache or the cache pack.
+        """
+        method = getattr(type(self), method_name).im_func
+        if not hasattr(method, 'cache'):
+            return False
+        key = method.keyer(self, *args)
+        return key in method.cache or \
+            get_packed_value(method.pack_name, key)[0]
+
+    def expire_cached(self, method_name, *args):
+        """Remove the cached result of calling the named method, if any."""
+        method = getattr(type(self), method_name).im_func
+        if not hasattr(method, 'cache'):
+            return
+        try:
+            method.cache.expire(method.keyer(self, *args))
+        except (KeyError, pyfscache.CacheError):
+            pass
+
+    def replace_cached(self, method_name, value, *args):
+        """
+        Cache value as the result of calling the named method with args,
+        replacing any cached result.
+        """
+        self.expire_cached(method_name, *args)
+        self.store_cached(method_name, value, *args)
+
+    def store_cached(self, method_name, value, *args):
+        """
+        Cache value as the result of calling the named method with args,
+        unless a result is already cached.
+        """
+        method = getattr(type(self), method_name).im_func
+        if not hasattr(method, 'cache'):
+            return
+        key = method.keyer(self, *args)
+        if key in method.cache:
+            return
+        try:
+            method.cache[key] = value
+        except pyfscache.CacheError:
+            # stored by another thread or process in the meantime
+            pass
+
+    @cache_comicvine('lookup_volume', get_lookup_key)
     def lookup_volume(self, volume_id):
         """Ensure the volume ID passed in matches a real volume."""
         self.log.debug('Looking up volume: %d' % volume_id)
 
+        if self.mirror is not None:
+            record = self.mirror.get_volume(volume_id)
+            if record is not None:
+                self.log.debug('Found volume in mirror: %d' % volume_id)
+                return Volume.from_record(record)
+
+        return self.fetch_volume(volume_id)
+
+    def fetch_volume(self, volume_id):
+        """Fetch a volume from comicvine, storing it in the mirror."""
+
+        # e.g. the volume of an issue, without its publisher
+        clear_pycomicvine_cache(pycomicvine.Volume, volume_id)
+
         @retry_on_comicvine_error(max_attempts=self.max_attempts)
         def run_query():
             return pycomicvine.Volume(id=volume_id, field_list=VOLUME_FIELDS)
@@ -259,31 +738,101 @@ class PyComicvineWrapper(object):
 
         if pycomicvine_volume:
             self.log.debug("Found volume: %d" % volume_id)
-            return Volume(pycomicvine_volume)
+            volume = Volume(pycomicvine_volume)
+            if self.mirror is not None:
+                self.mirror.store_volume(volume.to_record())
+            self.index_volumes([volume])
+            return volume
         else:
             self.log.warning("Failed to find volume: %d" % volume_id)
             return None
 
-    @cache_comicvine('lookup_issue')
+    @cache_comicvine('lookup_issue', get_lookup_key)
     def lookup_issue(self, issue_id):
         """Fetch the metadata we need, given an issue ID."""
         self.log.debug('Looking up issue: %d' % issue_id)
+        issue = self.find_mirrored_issue(issue_id, details=True) or \
+            self.fetch_issue(issue_id, ISSUE_FIELDS)
+        if issue is not None and self.prefetcher is not None:
+            self.prefetcher.submit(issue)
+        return issue
+
+    @cache_comicvine('lookup_issue_summary', get_lookup_key)
+    def lookup_issue_summary(self, issue_id):
+        """
+        Fetch the metadata needed to rank an issue, given an issue ID.
+
+        The returned issue has no description or author names.
+        """
+        self.log.debug('Looking up issue summary: %d' % issue_id)
+        return self.find_mirrored_issue(issue_id, details=False) or \
+            self.fetch_issue(issue_id, ISSUE_SUMMARY_FIELDS)
+
+    def find_issue_summaries(self, issue_ids):
+        """
+        Return the summaries of the issues found, as by lookup_issue_summary,
+        for ranking candidates. Summaries which are not cached or mirrored
+        are listed by ID, in as few requests as possible, and cached.
+        """
+        summaries = {}
+        missing_ids = []
+        for issue_id in issue_ids:
+            if self.is_cached('lookup_issue_summary', issue_id):
+                summaries[issue_id] = self.lookup_issue_summary(issue_id)
+            else:
+                summary = self.find_mirrored_issue(issue_id, details=False)
+                if summary is None:
+                    missing_ids.append(issue_id)
+                else:
+                    # as lookup_issue_summary would, so that identify
+                    # results ranked on it can be cached
+                    self.store_cached('lookup_issue_summary', summary,
+                                      issue_id)
+                    summaries[issue_id] = summary
+
+        for issue in self.list_by_ids(pycomicvine.Issues, 'id', missing_ids,
+                                      [], ISSUE_SUMMARY_FIELDS):
+            summary = self.make_issue(issue, has_details=False)
+            self.store_cached('lookup_issue_summary', summary, summary.id)
+            summaries[summary.id] = summary
+
+        return [summaries[issue_id] for issue_id in issue_ids
+                if summaries.get(issue_id) is not None]
+
+    def find_mirrored_issue(self, issue_id, details):
+        """Find an issue in the mirror, if there is one."""
+        if self.mirror is not None:
+            record = self.mirror.get_issue(issue_id, details=details)
+            if record is not None:
+                self.log.debug('Found issue in mirror: %d' % issue_id)
+                return Issue.from_record(record)
+        return None
+
+    def fetch_issue(self, issue_id, field_list):
+        """
+        Fetch the given issue fields from comicvine, storing the issue in
+        the mirror.
+        """
 
         # Pycomicvine appears to share object caches between
         # Issues() and Issue(), and the return data from comicvine
         # isn't actually compatible between those two APIs
-        clear_pycomicvine_issue_cache(issue_id)
+        clear_pycomicvine_cache(pycomicvine.Issue, issue_id)
 
         @retry_on_comicvine_error(max_attempts=self.max_attempts)
         def run_query():
-            return pycomicvine.Issue(id=issue_id, field_list=ISSUE_FIELDS)
+            return pycomicvine.Issue(id=issue_id, field_list=field_list)
 
         issue = run_query()
 
         if issue and issue.volume:
             self.log.debug('Found issue: %d %s #%s' %
                            (issue_id, issue.volume.name, issue.issue_number))
-            return Issue(issue)
+            result = self.make_issue(
+                issue, has_details='description' in field_list)
+            if self.mirror is not None:
+                self.mirror.store_issue(result.to_record())
+            return result
         elif issue:
             self.log.warning("Found issue but failed to find issue volume: %d" %
                              issue_id)
@@ -292,48 +841,194 @@ class PyComicvineWrapper(object):
             self.log.warning("Failed to find issue: %d" % issue_id)
             return None
 
-    @cache_comicvine('search_for_issue_ids')
+    def make_issue(self, comicvine_issue, has_details):
+        """
+        Convert a pycomicvine issue, filling in the publisher from a lookup
+        of its volume, as issue responses only name the volume.
+        """
+        issue = Issue(comicvine_issue, has_details=has_details)
+        if issue.publisher_name is None and issue.volume_id is not None:
+            volume = self.find_known_volume(issue.volume_id)
+            if volume is not None:
+                issue.publisher_name = volume.publisher_name
+        return issue
+
+    def find_known_volume(self, volume_id):
+        """
+        Return a volume from the volume index, such as one found by a
+        recent volume search, or else look it up.
+        """
+        if self.volume_index is not None:
+            volume = self.volume_index.get(volume_id)
+            if volume is not None:
+                return volume
+        return self.lookup_volume(volume_id)
+
+    @cache_comicvine('search_for_issue_ids', get_issue_search_key)
     def search_for_issue_ids(self, volume_ids, issue_number):
         """Search for all issue IDs which match the given filters."""
-
-        page_size = self.issue_search_page_size
-
-        volume_id_pages = [volume_ids[i:i + page_size]
-                           for i in range(0, len(volume_ids), page_size)]
-
         all_issue_ids = []
+        if self.mirror is not None:
+            all_issue_ids, volume_ids = self.mirror.find_issue_ids(
+                volume_ids, issue_number)
+            self.log.debug('%d issue ID matches found in mirror: %s' %
+                           (len(all_issue_ids), all_issue_ids))
+
+        cached_index = {}
+        for volume_id in volume_ids:
+            issues = _volume_issue_numbers.get(get_lookup_key(volume_id))
+            if issues is not None:
+                cached_index[volume_id] = issues
+        if cached_index:
+            cached_ids = parser.find_indexed_issue_ids(cached_index,
+                                                       issue_number)
+            self.log.debug('%d issue ID matches found in cache: %s' %
+                           (len(cached_ids), cached_ids))
+            all_issue_ids.extend(cached_ids)
+            volume_ids = [volume_id for volume_id in volume_ids
+                          if volume_id not in cached_index]
+
+        filters = []
+        if issue_number is not None:
+            filters.append('issue_number:%s' % issue_number)
+
+        issues = self.list_volume_issues(volume_ids, filters, ['id'])
+        all_issue_ids.extend(issue.id for issue in issues)
 
-        for paged_volume_ids in volume_id_pages:
-            filters = ['volume:%s' %
-                       ('|'.join(str(id) for id in paged_volume_ids))]
+        self.log.debug('%d total issue ID matches found: %s' %
+                       (len(all_issue_ids), all_issue_ids))
+        return all_issue_ids
 
-            if issue_number is not None:
-                filters.append('issue_number:%s' % issue_number)
+    def list_volume_issues(self, volume_ids, filters, field_list):
+        """
+        List the pycomicvine issues in any of the volumes which also match
+        the given filters.
+        """
+        return self.list_by_ids(pycomicvine.Issues, 'volume', volume_ids,
+                                filters, field_list)
 
-            filter_string = ','.join(filters)
-            self.log.debug('Searching for issues: %s' % filter_string)
+    def list_by_ids(self, resource_type, filter_name, ids, filters,
+                    field_list):
+        """
+        List the pycomicvine resources of a list resource type, such as
+        pycomicvine.Issues, where the named filter matches any of the IDs,
+        and which also match the given filters.
 
-            @retry_on_comicvine_error(max_attempts=self.max_attempts)
-            def run_query():
-                return pycomicvine.Issues(filter=filter_string,
-                                          field_list=['id'])
+        IDs are packed into as few requests as the URL length allows. If
+        Comicvine still rejects a request as too long, the length budget is
+        lowered and the request is retried with fewer IDs.
+        """
+        max_length = self.max_url_length
+        pending_ids = list(ids)
+        all_resources = []
+
+        while pending_ids:
+            base_length = get_id_filter_url_length(
+                resource_type, filter_name, [], filters, field_list)
+            count = count_ids_within_url_length(pending_ids, base_length,
+                                                max_length)
+            paged_ids = pending_ids[:count]
+            filter_string = get_id_filter(filter_name, paged_ids, filters)
+            self.log.debug('Searching for %s: %s' %
+                           (resource_type.__name__, filter_string))
 
-            issues = run_query()
+            @retry_on_comicvine_error(max_attempts=self.max_attempts)
+            def run_query(offset):
+                return resource_type(filter=filter_string,
+                                     field_list=field_list,
+                                     offset=offset, limit=LIST_PAGE_SIZE)
+
+            try:
+                resources = list_pages(run_query)
+            except HTTPError as error:
+                if error.code != 414 or count == 1:
+                    raise
+                max_length = get_id_filter_url_length(
+                    resource_type, filter_name, paged_ids, filters,
+                    field_list) - 1
+                self.log.warning('Request URL too long, retrying with at '
+                                 'most %d characters' % max_length)
+                continue
 
             # it is possible for pycomicvine to return iterables containing None
-            issues = [a for a in issues if a is not None]
-            paged_issue_ids = [issue.id for issue in issues]
-            self.log.debug('%d issue ID matches found: %s' %
-                           (len(paged_issue_ids), paged_issue_ids))
-            all_issue_ids.extend(paged_issue_ids)
+            resources = [a for a in resources if a is not None]
+            self.log.debug('%d matches found: %s' %
+                           (len(resources), [r.id for r in resources]))
+            all_resources.extend(resources)
+            pending_ids = pending_ids[count:]
 
-        self.log.debug('%d total issue ID matches found: %s' %
-                       (len(all_issue_ids), all_issue_ids))
-        return all_issue_ids
+        return all_resources
 
-    @cache_comicvine('search_for_volumes', limit=PREFS['search_volume_limit'])
+    def find_volume_issue_numbers(self, volume_ids):
+        """
+        Return a dict of volume ID to the list of (issue ID, issue number)
+        pairs in that volume.
+
+        Each volume's list is cached separately, and uncached volumes are
+        listed with as few requests as possible.
+        """
+        index = {}
+        missing_ids = []
+        for volume_id in set(int(id) for id in volume_ids):
+            issues = _volume_issue_numbers.get(get_lookup_key(volume_id))
+            if issues is None:
+                missing_ids.append(volume_id)
+            else:
+                index[volume_id] = issues
+
+        if missing_ids and self.mirror is not None:
+            mirrored = self.mirror.get_volume_issue_numbers(missing_ids)
+            index.update(mirrored)
+            missing_ids = [volume_id for volume_id in missing_ids
+                           if volume_id not in mirrored]
+
+        if missing_ids:
+            fetched = dict((volume_id, []) for volume_id in missing_ids)
+            for issue in self.list_volume_issues(
+                    missing_ids, [], ['id', 'issue_number', 'volume']):
+                if issue.volume and issue.volume.id in fetched:
+                    fetched[issue.volume.id].append((issue.id,
+                                                     issue.issue_number))
+            for volume_id, issues in fetched.items():
+                _volume_issue_numbers.put(get_lookup_key(volume_id), issues,
+                                          None)
+            index.update(fetched)
+
+        return index
+
+    @cache_comicvine('search_for_volumes', get_volume_search_key,
+                     limit=PREFS['search_volume_limit'])
     def search_for_volumes(self, title_tokens):
         """Search for IDs of all volumes which match the given title tokens."""
+        if self.mirror is not None:
+            # only crawled volumes named by exactly the title tokens, as
+            # the mirror has just some of the volumes a search would find
+            records = self.mirror.search_volumes(title_tokens,
+                                                 self.search_volume_limit)
+            if records:
+                self.log.debug('%d volume matches found in mirror: %s' %
+                               (len(records), [r['id'] for r in records]))
+                return [Volume.from_record(record) for record in records]
+
+        # many volumes share a name, so the index only answers for names
+        # searched on comicvine within the cache hours, e.g. spelt or
+        # punctuated otherwise, and is only built once it can answer
+        search_key = get_name_search_key(title_tokens)
+        if self.local_volume_search and \
+                _volume_searches.get(search_key) is not None:
+            volume_index = self.get_volume_index()
+            volumes, confident = volume_index.search(title_tokens,
+                                                     self.search_volume_limit)
+            if not confident:
+                # the same name, spelt or punctuated differently
+                volumes = volume_index.search_similar(
+                    title_tokens, self.search_volume_limit,
+                    CONFIDENT_SIMILARITY)
+            if volumes:
+                self.log.debug('%d volume matches found locally: %s' %
+                               (len(volumes), [v.id for v in volumes]))
+                return volumes
+
         query_string = ' AND '.join(title_tokens)
         self.log.debug('Searching for volumes: %s' % query_string)
 
@@ -345,7 +1040,14 @@ class PyComicvineWrapper(object):
         comicvine_volumes = run_query()
         volumes = map_volumes(comicvine_volumes, self.search_volume_limit)
 
-        # extra query, heavily limited, in case the first query has zero results
+        # similar names, in case the first query has zero results
+        if not volumes and self.local_volume_search:
+            volumes = self.get_volume_index().search_similar(
+                title_tokens, 20, CANDIDATE_SIMILARITY)
+            self.log.debug('%d similar volumes found locally: %s' %
+                           (len(volumes), [v.id for v in volumes]))
+
+        # extra query, heavily limited, in case there are still no results
         if not volumes:
             query_string = ' '.join(title_tokens)
             self.log.debug(
@@ -359,19 +1061,362 @@ class PyComicvineWrapper(object):
             comicvine_volumes = run_secondary_query()
             volumes = map_volumes(comicvine_volumes, 20)
 
+        if self.mirror is not None:
+            for volume in volumes:
+                self.mirror.store_volume(volume.to_record())
+        self.index_volumes(volumes)
+        if self.local_volume_search:
+            now = time.time()
+            _volume_searches.put(search_key, now,
+                                 now + self.cache_hours * 3600)
+
         self.log.debug('%d volume ID matches found: %s' %
                        (len(volumes), [v.id for v in volumes]))
         return volumes
 
+    def cache_volume_issues(self, volume_ids):
+        """
+        Cache the issue numbers and issue summaries of every issue in the
+        volumes, listing them in as few requests as possible. Volumes with
+        cached issue numbers are skipped.
+        """
+        missing_ids = [volume_id for volume_id in volume_ids
+                       if _volume_issue_numbers.get(
+                           get_lookup_key(volume_id)) is None]
+        if not missing_ids:
+            return
+        fetched = dict((volume_id, []) for volume_id in missing_ids)
+        for issue in self.list_volume_issues(missing_ids, [],
+                                             ISSUE_SUMMARY_FIELDS):
+            summary = self.make_issue(issue, has_details=False)
+            if summary.volume_id in fetched:
+                fetched[summary.volume_id].append((summary.id,
+                                                   summary.issue_number))
+            self.store_cached('lookup_issue_summary', summary, summary.id)
+        for volume_id, issues in fetched.items():
+            _volume_issue_numbers.put(get_lookup_key(volume_id), issues, None)
+
+    def warm_volumes(self, volume_ids, details=False):
+        """
+        Prefetch the volumes, and the numbers and summaries of all their
+        issues, into the caches. Full issue lookups, one request per
+        issue, are only prefetched if details are requested.
+        """
+        volumes = self.find_volumes_by_ids(sorted(set(volume_ids)))
+        volume_ids = [volume.id for volume in volumes]
+        self.cache_volume_issues(volume_ids)
+        index = self.find_volume_issue_numbers(volume_ids)
+        issue_count = sum(len(issues) for issues in index.values())
+        if details:
+            for issues in index.values():
+                for issue_id, _ in issues:
+                    self.lookup_issue(issue_id)
+        self.log.info('Warmed %d volumes and %d issues' %
+                      (len(volumes), issue_count))
+
+    def find_volumes_by_ids(self, volume_ids):
+        """
+        Return the volumes found, as by lookup_volume. Volumes which are not
+        cached or mirrored are listed by ID, in as few requests as possible,
+        and cached.
+        """
+        volumes = {}
+        missing_ids = []
+        for volume_id in volume_ids:
+            if self.is_cached('lookup_volume', volume_id):
+                volumes[volume_id] = self.lookup_volume(volume_id)
+                continue
+            record = None
+            if self.mirror is not None:
+                record = self.mirror.get_volume(volume_id)
+            if record is None:
+                missing_ids.append(volume_id)
+            else:
+                volume = Volume.from_record(record)
+                self.store_cached('lookup_volume', volume, volume_id)
+                volumes[volume_id] = volume
+
+        listed = [Volume(volume) for volume in self.list_by_ids(
+            pycomicvine.Volumes, 'id', missing_ids, [], VOLUME_FIELDS)]
+        for volume in listed:
+            if self.mirror is not None:
+                self.mirror.store_volume(volume.to_record())
+            self.store_cached('lookup_volume', volume, volume.id)
+            volumes[volume.id] = volume
+        self.index_volumes(listed)
+
+        return [volumes[volume_id] for volume_id in volume_ids
+                if volumes.get(volume_id) is not None]
+
+    def list_publisher_volume_ids(self, publisher_id):
+        """List the IDs of all volumes of a publisher."""
+
+        @retry_on_comicvine_error(max_attempts=self.max_attempts)
+        def run_query():
+            return pycomicvine.Publisher(id=publisher_id,
+                                         field_list=['id', 'volumes'])
+
+        publisher = run_query()
+        return [volume.id for volume in publisher.volumes
+                if volume is not None]
+
+    def get_volume_index(self):
+        """
+        Return the index of every volume seen, first building it from the
+        mirror and the file cache.
+        """
+        if self.volume_index is None:
+            with self.volume_index_lock:
+                if self.volume_index is None:
+                    volume_index = VolumeIndex()
+                    for volume in self.iter_known_volumes():
+                        volume_index.add(volume)
+                    self.log.debug('Indexed %d known volumes' %
+                                   len(volume_index))
+                    self.volume_index = volume_index
+        return self.volume_index
+
+    def iter_known_volumes(self):
+        """Iterate over the volumes in the mirror and the file cache."""
+        if self.mirror is not None:
+            for record in self.mirror.get_volumes():
+                yield Volume.from_record(record)
+        for name in ['lookup_volume', 'search_for_volumes']:
+            for value in iter_cached_values(name):
+                for volume in value if isinstance(value, list) else [value]:
+                    if isinstance(volume, Volume):
+                        yield volume
+
+    def index_volumes(self, volumes):
+        """Add newly seen volumes to the volume index, once it is built."""
+        if self.volume_index is not None:
+            for volume in volumes:
+                self.volume_index.add(volume)
+
+    def mirror_volume(self, volume_id, details=False):
+        """
+        Store a volume and all of its issues in the mirror, as summaries
+        unless details are requested, which takes a request per issue.
+        """
+        self.log.info('Mirroring volume: %d' % volume_id)
+        # changes made during the crawl are picked up by the first sync
+        self.mirror.set_watermark_if_missing(SYNC_WATERMARK,
+                                             format_sync_time(time.time()))
+        volume = self.fetch_volume(volume_id)
+        if volume is None:
+            return
+        issues = [self.make_issue(issue, has_details=False) for issue in
+                  self.list_volume_issues([volume_id], [],
+                                          ISSUE_SUMMARY_FIELDS)]
+        if details:
+            issues = [self.fetch_issue(issue.id, ISSUE_FIELDS) or issue
+                      for issue in issues]
+        self.mirror.store_volume_issues(volume.to_record(),
+                                        [issue.to_record() for issue in issues])
+        self.log.info('Mirrored %d issues of volume: %d %s' %
+                      (len(issues), volume_id, volume.name))
+
+    def mirror_publisher(self, publisher_id, details=False):
+        """Store all volumes of a publisher, and their issues, in the mirror."""
+        self.log.info('Mirroring publisher: %d' % publisher_id)
+        for volume_id in self.list_publisher_volume_ids(publisher_id):
+            self.mirror_volume(volume_id, details=details)
+
+    def sync_mirror(self):
+        """
+        Update the mirrored volumes and issues which Comicvine reports as
+        changed since the last sync, or since they were first mirrored.
+
+        Only volumes mirrored with all their issues are synced, not those
+        stored from search results, as only they are answered from the
+        mirror. Issues stored with details are refetched in full. The window
+        overlaps the previous sync, so that no change is missed because of
+        clock or timezone differences with Comicvine.
+        """
+        since = self.mirror.get_watermark(SYNC_WATERMARK)
+        if since is None:
+            self.log.info('Nothing to sync, no volumes have been mirrored')
+            return
+        now = time.time()
+        since_time = time.mktime(time.strptime(since, SYNC_TIME_FORMAT))
+        date_filter = 'date_last_updated:%s|%s' % (
+            format_sync_time(since_time - SYNC_OVERLAP),
+            format_sync_time(now + SYNC_OVERLAP))
+        self.log.info('Syncing mirror changes since: %s' % since)
+
+        volume_ids = self.mirror.get_complete_volume_ids()
+        volumes = [Volume(volume) for volume in self.list_by_ids(
+            pycomicvine.Volumes, 'id', volume_ids, [date_filter],
+            VOLUME_FIELDS)]
+        summaries = [self.make_issue(issue, has_details=False) for issue in
+                     self.list_volume_issues(volume_ids, [date_filter],
+                                             ISSUE_SUMMARY_FIELDS)]
+
+        # refetched rather than looked up, which would find the stale
+        # details in the mirror or the caches
+        detailed_ids = set(self.mirror.get_detailed_issue_ids(
+            [summary.id for summary in summaries]))
+        issues = [self.fetch_issue(summary.id, ISSUE_FIELDS) or summary
+                  if summary.id in detailed_ids else summary
+                  for summary in summaries]
+
+        self.mirror.store_sync([volume.to_record() for volume in volumes],
+                               [issue.to_record() for issue in issues],
+                               SYNC_WATERMARK, format_sync_time(now))
+        for volume in volumes:
+            self.replace_cached('lookup_volume', volume, volume.id)
+        for summary in summaries:
+            self.replace_cached('lookup_issue_summary', summary, summary.id)
+        for issue in issues:
+            if issue.has_details:
+                self.replace_cached('lookup_issue', issue, issue.id)
+        self.log.info('Synced %d volumes and %d issues' %
+                      (len(volumes), len(issues)))
+
+    def mirror_cached(self):
+        """
+        Store every volume and issue found in the file cache in the mirror.
+        """
+        count = 0
+        for name in ['lookup_volume', 'search_for_volumes']:
+            for value in iter_cached_values(name):
+                volumes = value if isinstance(value, list) else [value]
+                for volume in volumes:
+                    if isinstance(volume, Volume):
+                        self.mirror.store_volume(volume.to_record())
+                        count += 1
+        for name in ['lookup_issue_summary', 'lookup_issue']:
+            for issue in iter_cached_values(name):
+                if isinstance(issue, Issue):
+                    self.mirror.store_issue(issue.to_record())
+                    count += 1
+        self.log.info('Mirrored %d cached records' % count)
+
+
+class NeighborPrefetcher(object):
+    """
+    Prefetch, in the background, the issues which follow each looked up
+    issue in its volume, as libraries are usually added a run of issues
+    at a time.
+
+    The volume's issue numbers and summaries are cached with one list
+    request, then the next few issues are looked up in full. Background
+    requests only use spare tokens, so they never delay foreground
+    requests; when there are none, the prefetch is dropped.
+    """
+
+    def __init__(self, client, count):
+        self.client = client
+        self.count = count
+        self.queue = Queue(maxsize=PREFETCH_QUEUE_SIZE)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, issue):
+        """Queue a looked up issue for its neighbors to be prefetched."""
+        if getattr(_background_requests, 'reserve', None) is not None:
+            # looked up by the prefetcher itself
+            return
+        if issue.volume_id is None:
+            return
+        try:
+            self.queue.put_nowait(issue)
+        except Full:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run,
+                                               name='comicvine-prefetch')
+                self.thread.daemon = True
+                self.thread.start()
+
+    def run(self):
+        """Prefetch the neighbors of queued issues, forever."""
+        _background_requests.reserve = max(
+            1, PREFS['request_batch_size'] // 2)
+        while True:
+            issue = self.queue.get()
+            try:
+                self.prefetch(issue)
+            except NoSpareTokenError:
+                self.client.log.debug('No spare requests to prefetch the '
+                                      'neighbors of issue: %d' % issue.id)
+            except Exception:
+                self.client.log.exception('Failed to prefetch the neighbors '
+                                          'of issue: %d' % issue.id)
+
+    def prefetch(self, issue):
+        """Prefetch the issues following the issue in its volume."""
+        self.client.cache_volume_issues([issue.volume_id])
+        index = self.client.find_volume_issue_numbers([issue.volume_id])
+        for issue_id in parser.get_following_issue_ids(
+                index.get(issue.volume_id, []), issue.issue_number,
+                self.count):
+            self.client.lookup_issue(issue_id)
+
+
+# versions of the compact pickled forms of Volume and Issue, see
+# restore_volume and restore_issue. Bump when the fields change, so that
+# entries cached by earlier releases are read as cache misses.
+VOLUME_VERSION = 1
+ISSUE_VERSION = 1
+
+# canonical copies of volume and publisher names, see intern_name
+_names = {}
+
+
+class RecordVersionError(ValueError):
+    """Raised when restoring a Volume or Issue pickled by another release."""
+    pass
+
+
+def intern_name(name):
+    """
+    Return a canonical copy of a volume or publisher name, so that the
+    many issues of a volume share one copy of its names in memory.
+    """
+    if name is None:
+        return None
+    return _names.setdefault(name, name)
+
+
+def restore_volume(version, *values):
+    """Restore a Volume from the values pickled by Volume.__reduce__."""
+    if version != VOLUME_VERSION:
+        raise RecordVersionError('Volume version %r' % (version,))
+    volume = Volume.__new__(Volume)
+    (volume.id, name, volume.start_year, publisher_name) = values
+    volume.name = intern_name(name)
+    volume.publisher_name = intern_name(publisher_name)
+    return volume
+
+
+def restore_issue(version, *values):
+    """Restore an Issue from the values pickled by Issue.__reduce__."""
+    if version != ISSUE_VERSION:
+        raise RecordVersionError('Issue version %r' % (version,))
+    issue = Issue.__new__(Issue)
+    (issue.id, issue.name, issue.issue_number, issue.has_details,
+     issue.description, author_names, issue.volume_id, volume_name,
+     publisher_name, image_urls, issue.date, issue.collection_score) = values
+    issue.volume_name = intern_name(volume_name)
+    issue.publisher_name = intern_name(publisher_name)
+    issue.author_names = list(author_names)
+    issue.image_urls = list(image_urls)
+    return issue
+
 
 class Volume(object):
     """
-    Eager-loaded data about a Comicvine volume. Serializable for caching.
+    Eager-loaded data about a Comicvine volume. Serializable for caching,
+    in a compact, versioned form, see restore_volume.
     """
 
+    __slots__ = ('id', 'name', 'start_year', 'publisher_name')
+
     def __init__(self, comicvine_volume):
         self.id = comicvine_volume.id
-        self.name = comicvine_volume.name
+        self.name = intern_name(comicvine_volume.name)
         if is_int(comicvine_volume.start_year):
             # Comicvine returns a mix of int / string / None for start_year.
             # One time, they sent the string "1952?"
@@ -379,32 +1424,76 @@ class Volume(object):
         else:
             self.start_year = None
 
+        if comicvine_volume.publisher:
+            self.publisher_name = intern_name(comicvine_volume.publisher.name)
+        else:
+            self.publisher_name = None
+
+    def __reduce__(self):
+        """Pickle the volume as the arguments of restore_volume."""
+        return restore_volume, (VOLUME_VERSION, self.id, self.name,
+                                self.start_year, self.publisher_name)
+
+    @classmethod
+    def from_record(cls, record):
+        """Restore a volume from a record made by to_record."""
+        volume = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(volume, field, record.get(field))
+        volume.name = intern_name(volume.name)
+        volume.publisher_name = intern_name(volume.publisher_name)
+        return volume
+
+    def to_record(self):
+        """Return the volume's data as a dict, e.g. for the mirror."""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'start_year': self.start_year,
+            'publisher_name': self.publisher_name,
+        }
+
 
 class Issue(object):
     """
     Eager-loaded data about a Comicvine issue. Serializable for caching.
+
+    Issues without details were fetched with ISSUE_SUMMARY_FIELDS only, and
+    have no description or author names.
+
+    Pickled in a compact, versioned form, see restore_issue.
     """
 
-    def __init__(self, comicvine_issue):
+    __slots__ = ('id', 'name', 'issue_number', 'has_details', 'description',
+                 'author_names', 'volume_id', 'volume_name', 'publisher_name',
+                 'image_urls', 'date', 'collection_score')
+
+    def __init__(self, comicvine_issue, has_details=True):
         self.id = comicvine_issue.id
         self.name = comicvine_issue.name
         self.issue_number = comicvine_issue.issue_number
-        self.description = comicvine_issue.description
+        self.has_details = has_details
+
+        if has_details:
+            self.description = comicvine_issue.description
+        else:
+            self.description = None
 
-        if comicvine_issue.person_credits:
+        if has_details and comicvine_issue.person_credits:
             self.author_names = [p.name for p in comicvine_issue.person_credits]
         else:
             self.author_names = []
 
         if comicvine_issue.volume:
             self.volume_id = comicvine_issue.volume.id
-            self.volume_name = comicvine_issue.volume.name
+            self.volume_name = intern_name(comicvine_issue.volume.name)
         else:
             self.volume_id = None
             self.volume_name = None
 
         if comicvine_issue.volume and comicvine_issue.volume.publisher:
-            self.publisher_name = comicvine_issue.volume.publisher.name
+            self.publisher_name = intern_name(
+                comicvine_issue.volume.publisher.name)
         else:
             self.publisher_name = None
 
@@ -418,6 +1507,42 @@ class Issue(object):
             self.image_urls = []
 
         self.date = comicvine_issue.store_date or comicvine_issue.cover_date
+        self.collection_score = score_collection(self.description)
+
+    def __reduce__(self):
+        """Pickle the issue as the arguments of restore_issue."""
+        return restore_issue, (ISSUE_VERSION, self.id, self.name,
+                               self.issue_number, self.has_details,
+                               self.description, tuple(self.author_names),
+                               self.volume_id, self.volume_name,
+                               self.publisher_name, tuple(self.image_urls),
+                               self.date, self.collection_score)
+
+    @classmethod
+    def from_record(cls, record):
+        """Restore an issue from a record made by to_record."""
+        issue = cls.__new__(cls)
+        for field in cls.__slots__:
+            setattr(issue, field, record.get(field))
+        issue.volume_name = intern_name(issue.volume_name)
+        issue.publisher_name = intern_name(issue.publisher_name)
+        return issue
+
+    def to_record(self):
+        """Return the issue's data as a dict, e.g. for the mirror."""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'issue_number': self.issue_number,
+            'has_details': self.has_details,
+            'description': self.description,
+            'author_names': self.author_names,
+            'volume_id': self.volume_id,
+            'volume_name': self.volume_name,
+            'publisher_name': self.publisher_name,
+            'image_urls': self.image_urls,
+            'date': self.date,
+        }
 
     def get_full_title(self):
         """
@@ -445,6 +1570,22 @@ class Issue(object):
         else:
             return []
 
+    def get_collection_score(self):
+        """
+        Get ranking.score_collection of the description, which is kept
+        with the issue so that each cached issue is only scanned once.
+        """
+        score = self.collection_score
+        if score is None:
+            # issues restored from the mirror
+            score = self.collection_score = score_collection(self.description)
+        return score
+
+
+def format_sync_time(timestamp):
+    """Format a timestamp for the mirror sync watermark and date filters."""
+    return time.strftime(SYNC_TIME_FORMAT, time.localtime(timestamp))
+
 
 def map_volumes(comicvine_volumes, limit):
     """
@@ -463,6 +1604,116 @@ def map_volumes(comicvine_volumes, limit):
     return volumes
 
 
+def get_id_filter(filter_name, ids, filters):
+    """
+    Format a list resource filter for any of the IDs, plus filters.
+    """
+    id_filter = '%s:%s' % (filter_name, '|'.join(str(id) for id in ids))
+    return ','.join([id_filter] + list(filters))
+
+
+def get_id_filter_url_length(resource_type, filter_name, ids, filters,
+                             field_list):
+    """
+    Return the length of the encoded URL pycomicvine requests for the
+    list resource type and ID filter.
+    """
+    params = {
+        'api_key': pycomicvine.api_key,
+        'field_list': ','.join(field_list) + ',',
+        'filter': get_id_filter(filter_name, ids, filters),
+        'format': 'json',
+        'limit': LIST_PAGE_SIZE,
+        'offset': 0,
+    }
+    # the resource URLs of list types, e.g. 'issues/', match their names
+    return len('%s%s/?%s' % (pycomicvine._API_URL,
+                             resource_type.__name__.lower(),
+                             urlencode(params)))
+
+
+def list_pages(run_query):
+    """
+    List the resources of every page of a list request, requesting each
+    page with run_query(offset) rather than leaving pycomicvine to request
+    the pages after the first, which would bypass the retries and the
+    rate limit.
+    """
+    resources = []
+    offset = 0
+    while True:
+        page = run_query(offset)
+        stop = min(offset + LIST_PAGE_SIZE, len(page))
+        # indices rather than a slice, see map_volumes
+        resources.extend(page[index] for index in range(offset, stop))
+        if stop <= offset or stop >= len(page):
+            return resources
+        offset = stop
+
+
+def count_ids_within_url_length(ids, base_length, max_length):
+    """
+    Count how many of the leading IDs can be joined with '|' onto a URL of
+    base_length without exceeding max_length. Always at least one.
+    """
+    separator_length = len(quote_plus('|'))
+    length = base_length
+    count = 0
+    for an_id in ids:
+        length += len(quote_plus(str(an_id)))
+        if count:
+            length += separator_length
+        if count and length > max_length:
+            break
+        count += 1
+    return count
+
+
+def get_cache_root():
+    """Get the directory of all file caches, or None if there is none."""
+    temp_directory = os.getenv('TMPDIR')
+    if temp_directory is None:
+        return None
+    cache_root = os.path.join(temp_directory, 'calibre-comicvine')
+    if not os.path.isdir(cache_root):
+        return None
+    return cache_root
+
+
+def iter_cached_values(name):
+    """
+    Iterate over the unexpired values in the file cache of a cached
+    wrapper method, e.g. 'lookup_issue'.
+    """
+    cache_root = get_cache_root()
+    if cache_root is None:
+        return
+    for cache_name in sorted(os.listdir(cache_root)):
+        if not cache_name.startswith(name + '-hours-'):
+            continue
+        for _, contents in iter_cache_contents(
+                os.path.join(cache_root, cache_name)):
+            if not contents.expired():
+                yield contents.value
+
+
+def iter_cache_contents(cache_path):
+    """
+    Iterate over the (digest, cache object) pairs stored in the file
+    cache at the path, expired or not.
+    """
+    for file_name in sorted(os.listdir(cache_path)):
+        if file_name.endswith('.tmp'):
+            continue
+        try:
+            contents = pyfscache.fscache.load(
+                os.path.join(cache_path, file_name))
+        except Exception:
+            # partially written, or from an incompatible release
+            continue
+        yield file_name, contents
+
+
 def is_int(value):
     """
     Return true if the input can be converted to an int.
@@ -476,17 +1727,19 @@ def is_int(value):
         return False
 
 
-def clear_pycomicvine_issue_cache(issue_id):
+def clear_pycomicvine_cache(resource_type, resource_id):
     """
-    Clear out the instance cache within pycomicvine for the given issue.
+    Clear out the instance cache within pycomicvine for the given resource,
+    e.g. an issue, so that it is downloaded again rather than reused with
+    only the fields of an earlier response.
 
     This is a bit of a hack into a protected field of pycomicvine,
     but the reduction in additional queries to Comicvine is significant.
     """
     try:
-        type_id = pycomicvine.Types()[pycomicvine.Issue]['id']
+        type_id = pycomicvine.Types()[resource_type]['id']
     except KeyError:
         type_id = None
     if type_id:
-        key = "{0:d}-{1:d}".format(type_id, issue_id)
+        key = "{0:d}-{1:d}".format(type_id, resource_id)
         pycomicvine._cached_resources.pop(key, None)
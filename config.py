@@ -12,8 +12,16 @@ PREFS.defaults['request_batch_size'] = 16
 PREFS.defaults['retries'] = 3
 PREFS.defaults['send_logs_to_print'] = True
 PREFS.defaults['search_volume_limit'] = 100
-PREFS.defaults['issue_search_page_size'] = 50
+PREFS.defaults['max_url_length'] = 2000
 PREFS.defaults['cache_hours'] = 12
+PREFS.defaults['detail_lookup_limit'] = 10
+PREFS.defaults['hourly_request_quota'] = 200
+PREFS.defaults['mirror_path'] = ''
+PREFS.defaults['local_volume_search'] = True
+PREFS.defaults['cache_pack_path'] = ''
+PREFS.defaults['prefetch_neighbors'] = 0
+PREFS.defaults['stop_match_score'] = -1
+PREFS.defaults['confident_match_score'] = -1
 
 
 class ConfigWidget(QWidget):
@@ -69,6 +77,40 @@ class ConfigWidget(QWidget):
         self.add_labeled_widget('&search_volume_limit:',
                                 self.search_volume_limit)
 
+        # Mirror path is the file of an optional local database of volumes
+        # and issues, consulted before comicvine. Blank to disable.
+        self.mirror_path = QLineEdit(self)
+        self.mirror_path.setText(PREFS['mirror_path'])
+        self.add_labeled_widget('&Mirror database file:', self.mirror_path)
+
+        # Cache pack path is the file of an optional read-only pack of
+        # cached results, consulted after the file cache. Blank to disable.
+        self.cache_pack_path = QLineEdit(self)
+        self.cache_pack_path.setText(PREFS['cache_pack_path'])
+        self.add_labeled_widget('&Cache pack file:', self.cache_pack_path)
+
+        # Stop match score is the ranking score at or below which identify
+        # skips the lookups of the remaining candidates, dropping any still
+        # in flight, e.g. 0 for the issue with the comicvine ID given.
+        # Off at -1.
+        self.stop_match_score = QSpinBox(self)
+        self.stop_match_score.setMinimum(-1)
+        self.stop_match_score.setMaximum(100)
+        self.stop_match_score.setSpecialValueText('Off')
+        self.stop_match_score.setValue(PREFS['stop_match_score'])
+        self.add_labeled_widget('S&top match score:', self.stop_match_score)
+
+        # Confident match score is the match score at or below which an
+        # identify result is taken as the issue sought, skipping the
+        # lookups of the remaining candidates. Off at -1.
+        self.confident_match_score = QSpinBox(self)
+        self.confident_match_score.setMinimum(-1)
+        self.confident_match_score.setMaximum(100)
+        self.confident_match_score.setSpecialValueText('Off')
+        self.confident_match_score.setValue(PREFS['confident_match_score'])
+        self.add_labeled_widget('C&onfident match score:',
+                                self.confident_match_score)
+
     def add_labeled_widget(self, label_text, widget):
         """
         Add a configuration widget, incrementing the index for the next widget.
@@ -87,3 +129,7 @@ class ConfigWidget(QWidget):
         PREFS['request_batch_size'] = self.request_batch_size.value()
         PREFS['retries'] = self.retries.value()
         PREFS['search_volume_limit'] = self.search_volume_limit.value()
+        PREFS['mirror_path'] = unicode(self.mirror_path.text())
+        PREFS['cache_pack_path'] = unicode(self.cache_pack_path.text())
+        PREFS['stop_match_score'] = self.stop_match_score.value()
+        PREFS['confident_match_score'] = self.confident_match_score.value()
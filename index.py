@@ -0,0 +1,172 @@
+"""
+calibre_plugins.comicvine - A calibre metadata source for comicvine
+
+In-memory indexes over the names of known Comicvine volumes.
+"""
+import heapq
+import re
+import threading
+
+_WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+_NON_WORD_PATTERN = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def get_name_tokens(name):
+    """Split a volume name or title tokens into lowercase word tokens."""
+    return _WORD_PATTERN.findall((name or u'').lower())
+
+
+def get_compact_name(name):
+    """
+    Lowercase a name and strip everything but letters and digits, so that
+    e.g. 'A-Force' and 'a force' compare equal.
+    """
+    return _NON_WORD_PATTERN.sub(u'', (name or u'').lower())
+
+
+def get_trigrams(compact_name):
+    """
+    Return the set of character trigrams of a compact name. Names shorter
+    than three characters are their own only trigram.
+    """
+    if len(compact_name) < 3:
+        return set([compact_name]) if compact_name else set()
+    return set(compact_name[i:i + 3] for i in range(len(compact_name) - 2))
+
+
+def get_trigram_containment(trigrams, other_trigrams):
+    """The fraction of trigrams found in other_trigrams, 0.0 to 1.0."""
+    if not trigrams:
+        return 0.0
+    return float(len(trigrams & other_trigrams)) / len(trigrams)
+
+
+class TrigramIndex(object):
+    """
+    Index of the character trigrams of volume names, for finding the
+    volumes with the most similar names despite misspellings, punctuation
+    and spacing.
+
+    Volumes are any objects with id and name attributes. Not thread-safe
+    by itself, see VolumeIndex.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.trigrams = {}
+        self.volumes = {}
+
+    def add(self, volume):
+        """Add a volume, replacing any earlier volume with the same ID."""
+        self.remove(volume.id)
+        trigrams = get_trigrams(get_compact_name(volume.name))
+        self.volumes[volume.id] = volume
+        self.trigrams[volume.id] = trigrams
+        for trigram in trigrams:
+            self.postings.setdefault(trigram, set()).add(volume.id)
+
+    def remove(self, volume_id):
+        """Remove the volume with the ID, if it was added."""
+        for trigram in self.trigrams.pop(volume_id, ()):
+            self.postings[trigram].discard(volume_id)
+        self.volumes.pop(volume_id, None)
+
+    def search(self, name, limit, min_similarity=0.0):
+        """
+        Return up to limit (similarity, volume) pairs, most similar first,
+        for the volumes whose names are at least min_similarity similar to
+        the name. Similarity is the Dice coefficient of the trigram sets.
+        """
+        trigrams = get_trigrams(get_compact_name(name))
+        shared_counts = {}
+        for trigram in trigrams:
+            for volume_id in self.postings.get(trigram, ()):
+                shared_counts[volume_id] = shared_counts.get(volume_id, 0) + 1
+
+        matches = []
+        for volume_id, shared_count in shared_counts.items():
+            similarity = 2.0 * shared_count / (len(trigrams) +
+                                               len(self.trigrams[volume_id]))
+            if similarity >= min_similarity:
+                matches.append((similarity, -volume_id))
+        return [(similarity, self.volumes[-negative_id])
+                for (similarity, negative_id) in heapq.nlargest(limit, matches)]
+
+
+class VolumeIndex(object):
+    """
+    Inverted index of volume name tokens to the IDs of the volumes whose
+    names contain them.
+
+    Volumes are any objects with id and name attributes, such as
+    client.Volume, and are returned as added. Volume names are also
+    indexed by trigram, see search_similar. The index may be shared
+    between threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.postings = {}
+        self.volumes = {}
+        self.trigram_index = TrigramIndex()
+
+    def __len__(self):
+        return len(self.volumes)
+
+    def add(self, volume):
+        """Add a volume, replacing any earlier volume with the same ID."""
+        with self.lock:
+            previous = self.volumes.get(volume.id)
+            if previous is not None:
+                for token in set(get_name_tokens(previous.name)):
+                    self.postings[token].discard(volume.id)
+            self.volumes[volume.id] = volume
+            for token in set(get_name_tokens(volume.name)):
+                self.postings.setdefault(token, set()).add(volume.id)
+            self.trigram_index.add(volume)
+
+    def get(self, volume_id):
+        """Return the volume with the ID, or None."""
+        with self.lock:
+            return self.volumes.get(volume_id)
+
+    def search(self, title_tokens, limit):
+        """
+        Return (volumes, confident): up to limit volumes whose names
+        contain every one of the title tokens, and whether any of them is
+        named by exactly the title tokens. Confident only means among the
+        volumes seen so far.
+
+        Exact matches come first, then volumes with the fewest extra words.
+        """
+        query_tokens = set(get_name_tokens(u' '.join(title_tokens)))
+        if not query_tokens:
+            return [], False
+        with self.lock:
+            postings = [self.postings.get(token, ()) for token in query_tokens]
+            postings.sort(key=len)
+            volume_ids = set(postings[0])
+            for posting in postings[1:]:
+                if not volume_ids:
+                    break
+                volume_ids.intersection_update(posting)
+
+            ranked = []
+            for volume_id in volume_ids:
+                volume = self.volumes[volume_id]
+                extra_tokens = len(set(get_name_tokens(volume.name)) -
+                                   query_tokens)
+                ranked.append((extra_tokens, volume_id, volume))
+        ranked.sort(key=lambda entry: entry[:2])
+        confident = bool(ranked) and ranked[0][0] == 0
+        return [volume for (_, _, volume) in ranked[:limit]], confident
+
+    def search_similar(self, title_tokens, limit, min_similarity):
+        """
+        Return up to limit volumes whose names are at least min_similarity
+        similar to the title tokens, by trigrams, most similar first.
+        """
+        with self.lock:
+            matches = self.trigram_index.search(u' '.join(title_tokens),
+                                                limit, min_similarity)
+        return [volume for (similarity, volume) in matches]
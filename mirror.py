@@ -0,0 +1,347 @@
+"""
+calibre_plugins.comicvine - A calibre metadata source for comicvine
+
+Local SQLite mirror of Comicvine volumes and issues.
+"""
+import datetime
+import json
+import sqlite3
+import threading
+
+from index import get_name_tokens
+import parser
+
+# sqlite limits the number of variables in a single statement
+_MAX_VARIABLES = 500
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS volumes (
+        id INTEGER PRIMARY KEY,
+        name TEXT,
+        start_year INTEGER,
+        publisher_name TEXT,
+        issues_complete INTEGER NOT NULL DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS issues (
+        id INTEGER PRIMARY KEY,
+        volume_id INTEGER,
+        volume_name TEXT,
+        publisher_name TEXT,
+        name TEXT,
+        issue_number TEXT,
+        date TEXT,
+        image_urls TEXT,
+        has_details INTEGER NOT NULL DEFAULT 0,
+        description TEXT,
+        author_names TEXT
+    )''',
+    '''CREATE INDEX IF NOT EXISTS issues_volume_id
+        ON issues (volume_id)''',
+    '''CREATE TABLE IF NOT EXISTS watermarks (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    )''',
+)
+
+VOLUME_COLUMNS = ('id', 'name', 'start_year', 'publisher_name')
+
+ISSUE_COLUMNS = ('id', 'volume_id', 'volume_name', 'publisher_name', 'name',
+                 'issue_number', 'date', 'image_urls', 'has_details',
+                 'description', 'author_names')
+
+
+class ComicvineMirror(object):
+    """
+    Local store of Comicvine volume and issue records, as made by
+    client.Volume.to_record and client.Issue.to_record.
+
+    A volume is marked complete once all of its issues have been stored,
+    so that issue searches within it can be answered locally.
+
+    Connections may be shared between threads, but not between processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, timeout=30,
+                                          check_same_thread=False)
+        with self.lock, self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def close(self):
+        """Close the database connection."""
+        with self.lock:
+            self.connection.close()
+
+    def store_volume(self, record, issues_complete=False):
+        """
+        Insert or update a volume record, keeping any existing issues
+        complete flag unless issues_complete is set.
+        """
+        with self.lock, self.connection:
+            self.upsert_volume(record, issues_complete)
+
+    def store_issue(self, record):
+        """
+        Insert or update an issue record. Issue summaries never replace
+        the details of an issue already stored with them.
+        """
+        with self.lock, self.connection:
+            self.upsert_issue(record)
+
+    def store_volume_issues(self, volume_record, issue_records):
+        """
+        Store a volume and the records of all its issues, in a single
+        transaction, and mark the volume's issues complete.
+        """
+        with self.lock, self.connection:
+            for record in issue_records:
+                self.upsert_issue(record)
+            self.upsert_volume(volume_record, issues_complete=True)
+
+    def store_sync(self, volume_records, issue_records, watermark_name,
+                   watermark):
+        """
+        Store updated volumes and issues and advance the named watermark,
+        in a single transaction.
+        """
+        with self.lock, self.connection:
+            for record in volume_records:
+                self.upsert_volume(record, issues_complete=False)
+            for record in issue_records:
+                self.upsert_issue(record)
+            self.connection.execute(
+                'INSERT OR REPLACE INTO watermarks (name, value) '
+                'VALUES (?, ?)', [watermark_name, watermark])
+
+    def get_watermark(self, name):
+        """Return the value of the named watermark, or None."""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT value FROM watermarks WHERE name = ?',
+                [name]).fetchone()
+        return row[0] if row else None
+
+    def set_watermark_if_missing(self, name, value):
+        """Set the named watermark, unless it is already set."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO watermarks (name, value) '
+                'VALUES (?, ?)', [name, value])
+
+    def get_volumes(self):
+        """Return the records of all stored volumes."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT %s FROM volumes ORDER BY id' %
+                ', '.join(VOLUME_COLUMNS)).fetchall()
+        return [from_row(row, VOLUME_COLUMNS) for row in rows]
+
+    def get_issues(self):
+        """Return the records of all stored issues."""
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT %s FROM issues ORDER BY id' %
+                ', '.join(ISSUE_COLUMNS)).fetchall()
+        return [from_row(row, ISSUE_COLUMNS) for row in rows]
+
+    def get_volume_ids(self):
+        """Return the IDs of all stored volumes."""
+        with self.lock:
+            return [volume_id for (volume_id,) in self.connection.execute(
+                'SELECT id FROM volumes ORDER BY id')]
+
+    def get_complete_volume_ids(self):
+        """
+        Return the IDs of the stored volumes whose issues are complete,
+        i.e. those stored with all their issues.
+        """
+        with self.lock:
+            return [volume_id for (volume_id,) in self.connection.execute(
+                'SELECT id FROM volumes WHERE issues_complete = 1 '
+                'ORDER BY id')]
+
+    def get_detailed_issue_ids(self, issue_ids):
+        """Return which of the issues are stored with details."""
+        detailed_ids = []
+        with self.lock:
+            for chunk in chunks(list(issue_ids), _MAX_VARIABLES):
+                detailed_ids.extend(
+                    issue_id for (issue_id,) in self.connection.execute(
+                        'SELECT id FROM issues WHERE has_details = 1 '
+                        'AND id IN (%s) ORDER BY id' %
+                        ', '.join('?' * len(chunk)), chunk))
+        return detailed_ids
+
+    def upsert_volume(self, record, issues_complete):
+        """Write a volume row, within the caller's transaction."""
+        row = to_row(record, VOLUME_COLUMNS)
+        self.connection.execute(
+            'INSERT OR IGNORE INTO volumes (%s) VALUES (%s)' % (
+                ', '.join(VOLUME_COLUMNS),
+                ', '.join('?' * len(VOLUME_COLUMNS))),
+            row)
+        self.connection.execute(
+            'UPDATE volumes SET %s WHERE id = ?' % ', '.join(
+                '%s = ?' % column for column in VOLUME_COLUMNS[1:]),
+            row[1:] + [record['id']])
+        if issues_complete:
+            self.connection.execute(
+                'UPDATE volumes SET issues_complete = 1 WHERE id = ?',
+                [record['id']])
+
+    def upsert_issue(self, record):
+        """Write an issue row, within the caller's transaction."""
+        row = to_row(record, ISSUE_COLUMNS)
+        self.connection.execute(
+            'INSERT OR IGNORE INTO issues (%s) VALUES (%s)' % (
+                ', '.join(ISSUE_COLUMNS),
+                ', '.join('?' * len(ISSUE_COLUMNS))),
+            row)
+        if record['has_details']:
+            columns = ISSUE_COLUMNS[1:]
+        else:
+            columns = [column for column in ISSUE_COLUMNS[1:]
+                       if column not in ('has_details', 'description',
+                                         'author_names')]
+        self.connection.execute(
+            'UPDATE issues SET %s WHERE id = ?' % ', '.join(
+                '%s = ?' % column for column in columns),
+            [row[ISSUE_COLUMNS.index(column)] for column in columns] +
+            [record['id']])
+
+    def get_volume(self, volume_id):
+        """Return the stored volume record, or None."""
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT %s FROM volumes WHERE id = ?' %
+                ', '.join(VOLUME_COLUMNS), [volume_id]).fetchone()
+        return from_row(row, VOLUME_COLUMNS) if row else None
+
+    def get_issue(self, issue_id, details=True):
+        """
+        Return the stored issue record, or None. If details are needed,
+        issues stored as summaries are not returned.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT %s FROM issues WHERE id = ?' %
+                ', '.join(ISSUE_COLUMNS), [issue_id]).fetchone()
+        if row is None:
+            return None
+        record = from_row(row, ISSUE_COLUMNS)
+        if details and not record['has_details']:
+            return None
+        return record
+
+    def search_volumes(self, title_tokens, limit):
+        """
+        Return up to limit records of the volumes named by exactly the
+        title tokens, ignoring case and punctuation, among the volumes
+        whose issues have all been stored, e.g. by crawling them.
+
+        Volumes stored from search results are left out. The mirror only
+        has some of the volumes a search would find, so a remote search
+        is still needed when none of the crawled volumes match.
+        """
+        query_tokens = set(get_name_tokens(u' '.join(title_tokens)))
+        if not query_tokens:
+            return []
+        conditions = ' AND '.join(["name LIKE ? ESCAPE '\\'"] *
+                                  len(query_tokens))
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT %s FROM volumes WHERE issues_complete = 1 AND %s '
+                'ORDER BY id' % (', '.join(VOLUME_COLUMNS), conditions),
+                ['%%%s%%' % escape_like(token)
+                 for token in query_tokens]).fetchall()
+        records = [from_row(row, VOLUME_COLUMNS) for row in rows]
+        records = [record for record in records
+                   if set(get_name_tokens(record['name'])) == query_tokens]
+        return records[:limit]
+
+    def get_volume_issue_numbers(self, volume_ids):
+        """
+        Return a dict of volume ID to (issue ID, issue number) pairs, for
+        each of the volumes whose issues are complete.
+        """
+        index = {}
+        with self.lock:
+            for chunk in chunks(list(volume_ids), _MAX_VARIABLES):
+                for (volume_id,) in self.connection.execute(
+                        'SELECT id FROM volumes WHERE issues_complete = 1 '
+                        'AND id IN (%s)' % ', '.join('?' * len(chunk)),
+                        chunk):
+                    index[volume_id] = []
+            for chunk in chunks(sorted(index), _MAX_VARIABLES):
+                for issue_id, volume_id, issue_number in \
+                        self.connection.execute(
+                            'SELECT id, volume_id, issue_number FROM issues '
+                            'WHERE volume_id IN (%s) ORDER BY id' %
+                            ', '.join('?' * len(chunk)), chunk):
+                    index[volume_id].append((issue_id, issue_number))
+        return index
+
+    def find_issue_ids(self, volume_ids, issue_number):
+        """
+        Find the IDs of issues matching the issue number, or all issues if
+        it is None, in the volumes whose issues are complete.
+
+        Returns (issue IDs, IDs of volumes that could not be searched).
+        """
+        index = self.get_volume_issue_numbers(volume_ids)
+        issue_ids = parser.find_indexed_issue_ids(index, issue_number)
+        missing_ids = [volume_id for volume_id in volume_ids
+                       if volume_id not in index]
+        return issue_ids, missing_ids
+
+
+def to_row(record, columns):
+    """Convert a record dict into a list of column values."""
+    row = []
+    for column in columns:
+        value = record.get(column)
+        if column in ('image_urls', 'author_names'):
+            value = json.dumps(value or [])
+        elif column == 'date' and hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif column == 'has_details':
+            value = 1 if value else 0
+        row.append(value)
+    return row
+
+
+def from_row(row, columns):
+    """Convert a row of column values back into a record dict."""
+    record = dict(zip(columns, row))
+    for column in ('image_urls', 'author_names'):
+        if column in record:
+            record[column] = json.loads(record[column] or '[]')
+    if 'date' in record:
+        record['date'] = parse_date(record['date'])
+    if 'has_details' in record:
+        record['has_details'] = bool(record['has_details'])
+    return record
+
+
+def parse_date(value):
+    """Parse a stored date, returning None for unrecognised values."""
+    if value:
+        for date_format in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+            try:
+                return datetime.datetime.strptime(value, date_format)
+            except ValueError:
+                pass
+    return None
+
+
+def escape_like(text):
+    """Escape the wildcards of a LIKE pattern."""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def chunks(values, size):
+    """Split values into lists of at most size values."""
+    return [values[i:i + size] for i in range(0, len(values), size)]
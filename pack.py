@@ -0,0 +1,142 @@
+"""
+calibre_plugins.comicvine - A calibre metadata source for comicvine
+
+Read-only pack files of cached Comicvine results, for sharing a warm
+cache between machines by copying a single file.
+
+A pack is a header, an index of fixed-size entries sorted by key, and
+the pickled records the index entries point to. The file is memory
+mapped, so looking up a key reads only its index probes and its record.
+"""
+import cPickle
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+MAGIC = 'CVPACK\x00\x00'
+VERSION = 1
+
+# magic, version, number of entries
+HEADER = struct.Struct('<8sII')
+# key, record offset, record length, expiration (0 for never)
+ENTRY = struct.Struct('<32sQId')
+KEY_LENGTH = 32
+
+
+# raised by unpickling records whose classes have changed since the pack
+# was written, e.g. by an earlier release
+RESTORE_ERRORS = (AttributeError, ImportError, IndexError, TypeError,
+                  ValueError, cPickle.UnpicklingError)
+
+
+class PackError(Exception):
+    """Raised for pack files which cannot be read."""
+    pass
+
+
+def get_pack_key(name, digest):
+    """
+    Return the pack key of a cache entry, given the name of its cache and
+    the digest of its key, as made by pyfscache.make_digest.
+    """
+    return hashlib.sha256('%s/%s' % (name, digest)).digest()
+
+
+def write_pack(path, entries):
+    """
+    Write a pack of (pack key, expiration, value) entries, where the
+    expiration is in seconds since the epoch, or None for never.
+
+    The first entry for each key is kept. The pack is written to a
+    temporary file which is then renamed, so readers never see a partial
+    pack.
+    """
+    records = {}
+    for key, expiration, value in entries:
+        if key not in records:
+            records[key] = (expiration,
+                            cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL))
+
+    keys = sorted(records)
+    offset = HEADER.size + ENTRY.size * len(keys)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as pack_file:
+        pack_file.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+        for key in keys:
+            expiration, record = records[key]
+            pack_file.write(ENTRY.pack(key, offset, len(record),
+                                       expiration or 0))
+            offset += len(record)
+        for key in keys:
+            pack_file.write(records[key][1])
+    os.rename(tmp_path, path)
+    return len(keys)
+
+
+class CachePack(object):
+    """
+    A memory mapped, read-only pack file. Lookups may be made from many
+    threads at once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as pack_file:
+            try:
+                self.map = mmap.mmap(pack_file.fileno(), 0,
+                                     access=mmap.ACCESS_READ)
+            except (ValueError, mmap.error) as error:
+                raise PackError('Cannot map pack %s: %s' % (path, error))
+        if len(self.map) < HEADER.size:
+            self.close()
+            raise PackError('Not a pack: %s' % path)
+        magic, version, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise PackError('Unsupported pack %s, version %r' %
+                            (path, version))
+        if len(self.map) < HEADER.size + ENTRY.size * self.count:
+            self.close()
+            raise PackError('Truncated pack: %s' % path)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """Unmap the pack file."""
+        self.map.close()
+
+    def find(self, key):
+        """Return the index of the entry for key, or None."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = HEADER.size + ENTRY.size * middle
+            entry_key = self.map[start:start + KEY_LENGTH]
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def get(self, key):
+        """
+        Return (True, value) for an unexpired entry for key, or
+        (False, None) if there is none.
+        """
+        index = self.find(key)
+        if index is None:
+            return False, None
+        (_, offset, length, expiration) = ENTRY.unpack_from(
+            self.map, HEADER.size + ENTRY.size * index)
+        if expiration and expiration < time.time():
+            return False, None
+        try:
+            return True, cPickle.loads(self.map[offset:offset + length])
+        except RESTORE_ERRORS:
+            # a record whose class has changed since the pack was written
+            return False, None
@@ -2,20 +2,13 @@
 Expose methods for parsing titles into structured data.
 """
 
+from collections import namedtuple
 import re
 
-
-def normalised_title(title, tokenizer=None):
-    """
-    Returns (issue_number,title_tokens).
-
-    This method takes the provided title and breaks it down into
-    searchable components.  The issue number should be preceded by a
-    '#' mark or it will be treated as a word in the title.  Anything
-    provided after the issue number (e.g. a sub-title) will be
-    ignored.
-    """
-    replacements = (
+# regex replacements made, in order, to normalise a title, see
+# parse_normalised_title_regex
+TITLE_REPLACEMENTS = tuple(
+    (re.compile(pattern), replacement) for (pattern, replacement) in (
         (r'((?:^|\s)(?:\w\.){2,})',
          lambda match: match.group(0).replace('.', '')),
 
@@ -43,17 +36,99 @@ def normalised_title(title, tokenizer=None):
 
         # shrink whitespace to single spaces
         (r'\s{2,}', ' '),
-    )
+    ))
+
+ISSUE_PATTERN = re.compile(r'___([^:\s]+)___')
+
+YEAR_PATTERN = re.compile(r'\((\d{4})\)')
+
+ParsedTitle = namedtuple('ParsedTitle', ['issue_number', 'title_tokens',
+                                         'year'])
+
+# number of parsed titles to remember, see parse_title
+PARSE_CACHE_SIZE = 1024
+
+
+class ParseCache(object):
+    """
+    A bounded cache of parsed titles. When full, it is emptied, which
+    is cheaper than tracking the least recently used entry and works as
+    well for the repeated parses of the titles being identified.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = {}
+
+    def get(self, key):
+        """Return the parsed title cached for key, or None."""
+        return self.entries.get(key)
+
+    def put(self, key, parsed):
+        """Cache a parsed title."""
+        if len(self.entries) >= self.size:
+            self.entries.clear()
+        self.entries[key] = parsed
+
+    def clear(self):
+        """Forget every parsed title."""
+        self.entries.clear()
+
+
+_parse_cache = ParseCache(PARSE_CACHE_SIZE)
 
-    for pattern, replacement in replacements:
-        title = re.sub(pattern, replacement, title)
+
+def parse_title(title, tokenizer=None):
+    """
+    Returns a ParsedTitle of the title's issue number, title tokens (as a
+    tuple, empty without a tokenizer) and year, see normalised_title and
+    get_year.
+
+    Results are remembered for the most recently parsed titles, as the
+    same title is parsed many times while ranking its candidates.
+    """
+    key = (title, tokenizer)
+    parsed = _parse_cache.get(key)
+    if parsed is None:
+        (issue_number, title_tokens) = parse_normalised_title(title,
+                                                              tokenizer)
+        parsed = ParsedTitle(issue_number=issue_number,
+                             title_tokens=tuple(title_tokens),
+                             year=parse_year(title))
+        _parse_cache.put(key, parsed)
+    return parsed
+
+
+def normalised_title(title, tokenizer=None):
+    """
+    Returns (issue_number,title_tokens).
+
+    This method takes the provided title and breaks it down into
+    searchable components.  The issue number should be preceded by a
+    '#' mark or it will be treated as a word in the title.  Anything
+    provided after the issue number (e.g. a sub-title) will be
+    ignored.
+    """
+    parsed = parse_title(title, tokenizer)
+    return parsed.issue_number, list(parsed.title_tokens)
+
+
+def parse_normalised_title(title, tokenizer=None):
+    """
+    Parse a title as described by normalised_title, without the cache.
+
+    Each step of the normalisation takes linear time, so parsing does
+    too, whatever the title. The results are those of
+    parse_normalised_title_regex, the regex implementation it replaces.
+    """
+    for normalise in TITLE_NORMALISERS:
+        title = normalise(title)
 
     issue_number = None
-    issue_pattern = re.compile(r'___([^:\s]+)___')
-    issue_match = issue_pattern.search(title)
+    issue_match = ISSUE_PATTERN.search(title)
     if issue_match:
         issue_number = issue_match.group(1)
-        title = issue_pattern.sub('', title)
+        title = ISSUE_PATTERN.sub('', title)
 
     title_tokens = []
     if tokenizer is not None:
@@ -62,14 +137,210 @@ def normalised_title(title, tokenizer=None):
     return issue_number, title_tokens
 
 
+def parse_normalised_title_regex(title, tokenizer=None):
+    """
+    Parse a title as described by normalised_title, with the original
+    regex replacements. Kept as the reference for parse_normalised_title;
+    some titles take quadratic time or worse.
+    """
+    for pattern, replacement in TITLE_REPLACEMENTS:
+        title = pattern.sub(replacement, title)
+
+    issue_number = None
+    issue_match = ISSUE_PATTERN.search(title)
+    if issue_match:
+        issue_number = issue_match.group(1)
+        title = ISSUE_PATTERN.sub('', title)
+
+    title_tokens = []
+    if tokenizer is not None:
+        title_tokens = [token.lower() for token in tokenizer(title.strip())]
+
+    return issue_number, title_tokens
+
+
+# Character classes of mark_issue_number, by ordinal. As in the regex
+# replacements, which have no UNICODE flag, \s and \d are ASCII only.
+_SPACES = frozenset(ord(c) for c in ' \t\n\r\x0b\x0c')
+_DIGITS = frozenset(ord(c) for c in '0123456789')
+# [\d\xbd]: characters of an issue number
+_NUMBER = _DIGITS | frozenset([0xbd])
+# [#\d\xbd']: characters which cannot precede an issue number
+_NOT_TITLE = _NUMBER | frozenset([ord('#'), ord("'")])
+
+(_COLON, _HASH, _QUOTE, _ZERO) = [ord(c) for c in ":#'0"]
+
+
+def replace_pattern(index):
+    """Return a normaliser making the replacement TITLE_REPLACEMENTS[index]."""
+    (pattern, replacement) = TITLE_REPLACEMENTS[index]
+    return lambda title: pattern.sub(replacement, title)
+
+
+def remove_parenthesized(title):
+    """
+    Replace each parenthesized group of words with a space.
+
+    Unlike the regex, which looks for a ')' after every '(', this
+    remembers where the next ')' is, so '((((...' takes linear time.
+    """
+    parts = []
+    copied = 0
+    close = -1
+    start = title.find('(')
+    while start != -1:
+        if close <= start:
+            close = title.find(')', start + 1)
+            if close == -1:
+                break
+        if close > start + 1:
+            parts.append(title[copied:start])
+            parts.append(' ')
+            copied = close + 1
+            start = title.find('(', copied)
+        else:
+            start = title.find('(', start + 1)
+    parts.append(title[copied:])
+    return ''.join(parts)
+
+
+def mark_issue_number(title):
+    """
+    Replace the issue number with "___123___", and remove everything after
+    it, ignoring issue numbers that are the first word or that start with
+    a single-quote character. The issue number is the last number in the
+    title, optionally followed by a ':' and a subtitle without digits.
+    """
+    codes = [ord(c) for c in title]
+    length = len(codes)
+    if not length:
+        return title
+
+    last_digit = -1
+    for i in range(length - 1, -1, -1):
+        if codes[i] in _DIGITS:
+            last_digit = i
+            break
+
+    # end of the run of characters other than ':' and spaces at each position
+    word_end = [length] * (length + 1)
+    for i in range(length - 1, -1, -1):
+        if codes[i] == _COLON or codes[i] in _SPACES:
+            word_end[i] = i
+        else:
+            word_end[i] = word_end[i + 1]
+
+    start = 0
+    while start < length:
+        if codes[start] in _NOT_TITLE:
+            start += 1
+            continue
+        # the title before the issue number runs until a '#', digit or quote
+        title_end = start
+        while title_end < length and codes[title_end] not in _NOT_TITLE:
+            title_end += 1
+        number_start = number_scan(codes, title_end)
+        if number_start is not None:
+            number_end = word_end[number_start]
+            if last_digit < number_end:
+                return '%s___%s___' % (title[:title_end],
+                                       title[number_start:number_end])
+        start = title_end
+    return title
+
+
+def number_scan(codes, i):
+    """
+    Find where the issue number starts, given the end of the title before
+    it: after an optional '#' and leading zeros, keeping a lone zero.
+    Returns None if there is no issue number there.
+    """
+    if i >= len(codes) or codes[i] == _QUOTE:
+        return None
+    if codes[i] == _HASH:
+        i += 1
+    zeros_end = i
+    while zeros_end < len(codes) and codes[zeros_end] == _ZERO:
+        zeros_end += 1
+    if zeros_end < len(codes) and codes[zeros_end] in _NUMBER:
+        return zeros_end
+    elif zeros_end > i:
+        return zeros_end - 1
+    return None
+
+
+# the steps of parse_normalised_title, in the order of
+# TITLE_REPLACEMENTS. The regexes which backtrack are replaced with
+# scanners; the others take linear time already.
+TITLE_NORMALISERS = (
+    replace_pattern(0),
+    replace_pattern(1),
+    replace_pattern(2),
+    replace_pattern(3),
+    replace_pattern(4),
+    remove_parenthesized,
+    mark_issue_number,
+    replace_pattern(7),
+)
+
+
 def get_issue_number(title):
-    (issue_number, title_tokens) = normalised_title(title)
-    return issue_number
+    return parse_title(title).issue_number
+
+
+def normalised_issue_number(issue_number):
+    """
+    Strip leading zeros from an issue number, as normalised_title does,
+    so that issue numbers from titles and from comicvine can be compared.
+    """
+    if issue_number is None:
+        return None
+    return re.sub(u'^0+(?=[\d\xbd])', '', issue_number)
+
+
+def find_indexed_issue_ids(issue_index, issue_number):
+    """
+    Find the IDs of issues in a dict of volume ID to (issue ID, issue
+    number) pairs which match the issue number, or all issues if the issue
+    number is None.
+    """
+    issue_number = normalised_issue_number(issue_number)
+    issue_ids = []
+    for volume_id in sorted(issue_index):
+        for issue_id, candidate_number in issue_index[volume_id]:
+            if issue_number is None or \
+                    issue_number == normalised_issue_number(candidate_number):
+                issue_ids.append(issue_id)
+    return issue_ids
+
+
+def get_following_issue_ids(issues, issue_number, count):
+    """
+    Return the IDs of up to count of the (issue ID, issue number) issues
+    which follow the issue number, in issue number order. Issues without
+    numeric issue numbers have no order, and are never returned.
+    """
+    current = get_numeric_issue_number(issue_number)
+    if current is None:
+        return []
+    following = []
+    for issue_id, candidate_number in issues:
+        number = get_numeric_issue_number(candidate_number)
+        if number is not None and number > current:
+            following.append((number, issue_id))
+    return [issue_id for (_, issue_id) in sorted(following)[:count]]
+
+
+def get_numeric_issue_number(issue_number):
+    """Return an issue number as a float, or None if it is not numeric."""
+    try:
+        return float(re.sub(u'\xbd', '.5', issue_number))
+    except (TypeError, ValueError):
+        return None
 
 
 def get_title_tokens(title, tokenizer):
-    (issue_number, title_tokens) = normalised_title(title, tokenizer)
-    return title_tokens
+    return list(parse_title(title, tokenizer).title_tokens)
 
 
 def get_year(title):
@@ -78,8 +349,12 @@ def get_year(title):
     Returns that as the suspected year of this issue's publication.
     If no match is found, return None.
     """
-    match_year = re.compile(r'\((\d{4})\)')
-    matches = match_year.findall(title)
+    return parse_title(title).year
+
+
+def parse_year(title):
+    """Find the year of a title as described by get_year, without the cache."""
+    matches = YEAR_PATTERN.findall(title)
     return matches[-1] if matches else None
 
 
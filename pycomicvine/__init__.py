@@ -28,6 +28,7 @@ except ImportError:
     import json
 import sys, re
 import datetime, logging
+import threading
 import dateutil.parser
 from . import error
 import collections
@@ -37,8 +38,38 @@ _API_URL = "https://comicvine.gamespot.com/api/"
 
 _cached_resources = {}
 
+# attributes of resources which are never fields
+_OBJECT_ATTRIBUTES = frozenset([
+        '__class__',
+        '__dict__',
+        '__member__',
+        '__methods__',
+        '_request_object'
+    ])
+
+# marks a field value which has not been converted yet
+_UNCONVERTED = object()
+
 api_key = ""
 
+# With strict_fields, reading a field which was not downloaded returns
+# None, instead of requesting it from the API. Otherwise, each of these
+# implicit requests is logged and counted in implicit_requests.
+strict_fields = False
+implicit_requests = 0
+_implicit_requests_lock = threading.Lock()
+
+def _count_implicit_request(resource_type, detail_url, name):
+    global implicit_requests
+    with _implicit_requests_lock:
+        implicit_requests += 1
+    logging.getLogger(__name__).warning(
+            "Implicit request for field '%s' of %s %s",
+            name,
+            resource_type.__name__,
+            detail_url
+        )
+
 def str_to_datetime(value):
     try:
         return dateutil.parser.parse(value)
@@ -233,6 +264,7 @@ class _SingularResource(_Resource):
         ):
         if '_ready' not in self.__dict__:
             self._ready = True
+            self._converted = {}
             try:
                 type_id = Types()[type(self)]['id']
             except KeyError:
@@ -259,6 +291,10 @@ class _SingularResource(_Resource):
                 self._fields.update(self._request_object(
                         kwargs['field_list']
                     ).results)
+        elif do_not_download:
+            # the fields of a newer response, e.g. a list, replace any
+            # parsed earlier, so that they need not be requested again
+            self._fields.update(kwargs)
         if all and not do_not_download:
             if 'timeout' in kwargs:
                 self._fields.update(self._request_object(
@@ -278,42 +314,57 @@ class _SingularResource(_Resource):
                     timeout=timeout
                 )
 
+    @classmethod
+    def _attribute_definitions(type):
+        """
+        Return the AttributeDefinitions of the fields of the class, by
+        name, built once per class.
+        """
+        definitions = type.__dict__.get('_definitions')
+        if definitions is None:
+            definitions = dict(
+                    (name, value) for (name, value) in type.__dict__.items()
+                    if not name.startswith('_') and
+                    isinstance(value, AttributeDefinition)
+                )
+            type._definitions = definitions
+        return definitions
+
     def __getattribute__(self, name):
-        def _object_attribute(name):
+        instance_dict = object.__getattribute__(self, '__dict__')
+        name = object.__getattribute__(self, '_fix_api_error')(name)
+        if name in _OBJECT_ATTRIBUTES or name in instance_dict:
             return object.__getattribute__(self, name)
-
-        def _parse_attribute(name):
-            fields = _object_attribute('_fields')
-            value = _object_attribute('_fields')[name]
-            if name in filter(
-                    lambda x: not x.startswith('_'),
-                    type(self).__dict__
-                ):
-                definition = type(self).__dict__[name]
-                fields[name] = definition.convert(value)
-            return fields[name]
-
-        name = _object_attribute('_fix_api_error')(name)
         try:
-            if name not in [
-                    '__class__', 
-                    '__dict__', 
-                    '__member__', 
-                    '__methods__', 
-                    '_request_object'
-                ] and name not in self.__dict__:
-                if name in _object_attribute('_fields'):
-                    return _parse_attribute(name)
-                else:
-                    self._fields.update(
-                            _object_attribute('_request_object')(
-                                    [name]
-                                ).results
-                        )
-                    return _parse_attribute(name)
+            fields = instance_dict['_fields']
+            if name not in fields:
+                if strict_fields:
+                    if name in type(self)._attribute_definitions():
+                        return None
+                    return object.__getattribute__(self, name)
+                _count_implicit_request(
+                        type(self),
+                        instance_dict.get('_detail_url'),
+                        name
+                    )
+                fields.update(object.__getattribute__(
+                        self,
+                        '_request_object'
+                    )([name]).results)
+            value = fields[name]
+            # the converted value is stored as the field, so it is known
+            # to be converted until another download replaces the field
+            converted = instance_dict['_converted']
+            if converted.get(name, _UNCONVERTED) is value:
+                return value
+            definition = type(self)._attribute_definitions().get(name)
+            if definition is not None:
+                value = definition.convert(value)
+                fields[name] = value
+            converted[name] = value
+            return value
         except KeyError:
-            pass
-        return _object_attribute(name)
+            return object.__getattribute__(self, name)
 
     def _fix_api_error(self, name):
         return name
@@ -6,6 +6,7 @@ import cPickle
 import time
 import base64
 import inspect
+import threading
 
 __all__ = ["CacheError", "FSCache", "make_digest",
            "auto_cache_function", "cache_function", "to_seconds"]
@@ -13,6 +14,11 @@ __all__ = ["CacheError", "FSCache", "make_digest",
 class CacheError(Exception):
   pass
 
+# raised by unpickling objects whose classes have changed since they
+# were stored, e.g. by an earlier release
+RESTORE_ERRORS = (AttributeError, ImportError, IndexError, TypeError,
+                  ValueError)
+
 class TimeError(CacheError):
   pass
 
@@ -211,7 +217,11 @@ class FSCache(object):
         isin = False
     if isin:
       if contents.expired():
-        self.expire(k)
+        try:
+          self.expire(k)
+        except CacheError:
+          # already expired by another process
+          self.unload(k)
         isin = False
     return isin
   def __call__(self, f):
@@ -243,11 +253,20 @@ class FSCache(object):
     so don't use it as part of the API.
     """
     path = os.path.join(self._path, digest)
-    if os.path.exists(path):
+    try:
       contents = load(path)
-    else:
+    except (IOError, EOFError, cPickle.UnpicklingError):
+      # missing, or removed by another process since it was found
       msg = "Object for key `%s` does not exist." % (k,)
       raise CacheError, msg
+    except RESTORE_ERRORS:
+      # stale, so remove it to make way for a new object
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+      msg = "Object for key `%s` cannot be restored." % (k,)
+      raise CacheError, msg
     self._loaded[digest] = contents
     return contents
   def _remove(self, k):
@@ -259,9 +278,9 @@ class FSCache(object):
     """
     digest = make_digest(k)
     path = os.path.join(self._path, digest)
-    if os.path.exists(path):
+    try:
       os.remove(path)
-    else:
+    except OSError:
       msg = "No object for key `%s` stored." % str(k)
       raise CacheError, msg
   def is_loaded(self, k):
@@ -288,6 +307,19 @@ class FSCache(object):
     """
     self._remove(k)
     del self[k]
+  def get_item_expiration(self, k):
+    """
+    Returns the expiration, in seconds since the epoch, of the
+    object keyed by `k`, or ``None`` if it never expires. Raises
+    a `KeyError` if no unexpired object is keyed by `k`.
+    """
+    if k in self:
+      digest = make_digest(k)
+      expiration = self._loaded[digest].expiration
+    else:
+      msg = "No such key in cache: '%s'" % k
+      raise KeyError(msg)
+    return expiration
   def get_path(self):
     """
     Returns the absolute path to the file system cache represented
@@ -399,10 +431,23 @@ def dump(obj, filename):
   """
   Helper function that simply pickle dumps the object
   into the file named by `filename`.
+
+  The object is written to a temporary file which is then renamed,
+  so other processes never see a partially written file.
   """
-  f = open(filename, 'wb')
-  cPickle.dump(obj, f, cPickle.HIGHEST_PROTOCOL)
-  f.close()
+  tmp_filename = '%s.%d.%d.tmp' % (filename, os.getpid(),
+                                   threading.current_thread().ident)
+  f = open(tmp_filename, 'wb')
+  try:
+    cPickle.dump(obj, f, cPickle.HIGHEST_PROTOCOL)
+  finally:
+    f.close()
+  try:
+    os.rename(tmp_filename, filename)
+  except OSError:
+    # Windows will not rename over a file written by another process
+    os.remove(tmp_filename)
+    raise CacheError("Object file `%s` exists." % filename)
 
 def auto_cache_function(f, cache):
   """
@@ -452,7 +497,11 @@ def cache_function(f, keyer, cache):
       result = cache[k]
     else:
       result = f(*args, **kwargs)
-      cache[k] = result
+      try:
+        cache[k] = result
+      except CacheError:
+        # stored by another thread or process in the meantime
+        pass
     return result
   return _f
 
@@ -1,8 +1,11 @@
 """
 calibre_plugins.comicvine - A calibre metadata source for comicvine
 """
+import heapq
 import re
+import threading
 
+from index import get_compact_name, get_trigram_containment, get_trigrams
 import parser
 
 
@@ -10,27 +13,189 @@ def keygen(metadata,
            title=None,
            title_tokens_function=None,
            authors=None,
-           identifiers=None):
+           identifiers=None,
+           query=None):
+    """
+    Score a result, lower is better. Give a QueryContext as query to
+    avoid parsing the title again for every result.
+    """
     return IssueScorer(metadata=metadata,
                        title=title,
                        tokenizer=title_tokens_function,
                        authors=authors,
-                       identifiers=identifiers).score()
+                       identifiers=identifiers,
+                       query=query).score()
 
 
-class IssueScorer(object):
+def score_results(results, query):
+    """
+    Score many results against one QueryContext, returning the scores in
+    order. The scores are those of keygen, but the title scores, which
+    depend only on the series, are computed once per distinct series.
+    """
+    scores = []
+    series_scores = {}
+    for metadata in results:
+        scorer = IssueScorer(metadata=metadata, query=query)
+        if query.title is None or scorer.matches_identifier():
+            scores.append(0)
+            continue
+        series_score = series_scores.get(metadata.series)
+        if series_score is None:
+            series_score = (scorer.score_title_tokens() +
+                            scorer.score_title_length())
+            series_scores[metadata.series] = series_score
+        scores.append(series_score +
+                      scorer.score_authors() +
+                      scorer.score_publish_date() +
+                      scorer.score_issue_number() +
+                      scorer.score_comments())
+    return scores
+
+
+def best_results(results, query, limit):
+    """
+    Return the limit best results for a QueryContext, best first, in the
+    order sorting them by keygen would.
+    """
+    results = list(results)
+    ranked = heapq.nsmallest(limit, zip(score_results(results, query),
+                                        range(len(results))))
+    return [results[index] for (_, index) in ranked]
+
+
+class TopResults(object):
+    """
+    The best results for a QueryContext, ranked as they arrive. At most
+    limit results are kept, in a heap, or all of them if limit is None.
+
+    With a stop_score, is_done tells when enough results score that well
+    that no result still to come can displace them, so that outstanding
+    lookups can be skipped. With a confident_score, is_done also tells
+    when a result has a match score (see IssueScorer.score_match) that
+    good, which is trusted to be the issue sought. Results may be added
+    from many threads.
+    """
+
+    def __init__(self, query, limit=None, stop_score=None,
+                 confident_score=None):
+        self.query = query
+        self.limit = limit
+        self.stop_score = stop_score
+        self.confident_score = confident_score
+        self.confident = False
+        self.lock = threading.Lock()
+        # (-score, -arrival, result), so the root is the worst result,
+        # and the later of two equally scored results is dropped first
+        self.heap = []
+        self.count = 0
+        self.best_score = None
+
+    def add(self, result):
+        """Score and add a result, returning its score."""
+        scorer = IssueScorer(metadata=result, query=self.query)
+        score = scorer.score()
+        confident = self.confident_score is not None and \
+            self.query.title is not None and \
+            scorer.score_match() <= self.confident_score
+        with self.lock:
+            self.confident = self.confident or confident
+            self.count += 1
+            entry = (-score, -self.count, result)
+            if self.limit is None or len(self.heap) < self.limit:
+                heapq.heappush(self.heap, entry)
+            else:
+                heapq.heappushpop(self.heap, entry)
+            if self.best_score is None or score < self.best_score:
+                self.best_score = score
+        return score
+
+    def is_done(self):
+        """
+        True once the best result, or the limit best results, score
+        stop_score or better, or once a result is a confident match.
+        """
+        with self.lock:
+            if self.confident:
+                return True
+            if self.stop_score is None:
+                return False
+            if self.limit is None:
+                return self.best_score is not None and \
+                    self.best_score <= self.stop_score
+            return len(self.heap) == self.limit and \
+                -self.heap[0][0] <= self.stop_score
+
+    def results(self):
+        """
+        Return the kept results, best first, in the order sorting all the
+        added results by keygen would.
+        """
+        with self.lock:
+            return [result for (_, _, result) in sorted(self.heap,
+                                                        reverse=True)]
+
+
+class QueryContext(object):
+    """
+    The parts of an identify query which results are scored against,
+    parsed once so that scoring each result only compares them.
+    """
+
     def __init__(self,
-                 metadata,
                  title=None,
                  tokenizer=None,
                  authors=None,
                  identifiers=None):
-        self.metadata = metadata
         self.title = title
         self.tokenizer = tokenizer
-        self.authors = authors
+        self.authors = set(authors or ())
         self.identifiers = identifiers
 
+        self.title_tokens = []
+        self.issue_number = None
+        self.year = None
+        if title is not None:
+            self.title_tokens = parser.get_title_tokens(title, tokenizer)
+            self.issue_number = parser.get_issue_number(title)
+            year = parser.get_year(title)
+            if year:
+                self.year = int(year)
+        self.issue_value = None
+        if self.issue_number is not None:
+            try:
+                self.issue_value = float(self.issue_number)
+            except ValueError:
+                pass
+        self.sanitized_title = ' '.join(self.title_tokens).lower().strip()
+        # (lowercase token, compact token, trigrams of the compact token)
+        self.token_names = []
+        for token in self.title_tokens:
+            compact_token = get_compact_name(token)
+            self.token_names.append((token.lower(), compact_token,
+                                     get_trigrams(compact_token)))
+
+
+class IssueScorer(object):
+    def __init__(self,
+                 metadata,
+                 title=None,
+                 tokenizer=None,
+                 authors=None,
+                 identifiers=None,
+                 query=None):
+        if query is None:
+            query = QueryContext(title=title,
+                                 tokenizer=tokenizer,
+                                 authors=authors,
+                                 identifiers=identifiers)
+        self.metadata = metadata
+        self.query = query
+        self.title = query.title
+        self.tokenizer = query.tokenizer
+        self.authors = query.authors
+        self.identifiers = query.identifiers
+
     def score(self):
         """
         Implement multi-result comparisons. Lower rank values are more preferred.
@@ -71,6 +236,16 @@ class IssueScorer(object):
             'comments': self.score_comments(),
         }
 
+    def score_match(self):
+        """
+        Score how well the result matches the issue sought, ignoring the
+        authors, comments and series name length: the sum of the title
+        tokens, issue number and publish date scores.
+        """
+        return (self.score_title_tokens() +
+                self.score_issue_number() +
+                self.score_publish_date())
+
     def score_authors(self):
         """
         The more mismatches in the already-set authors, the higher the score,
@@ -92,9 +267,9 @@ class IssueScorer(object):
         """
         publish_date = self.metadata.pubdate
         if publish_date:
-            input_year = parser.get_year(self.title)
+            input_year = self.query.year
             if input_year:
-                return abs(publish_date.year - int(input_year)) * 3
+                return abs(publish_date.year - input_year) * 3
             else:
                 return 0
         else:
@@ -104,19 +279,28 @@ class IssueScorer(object):
         """
         Prefer results which contain all of the tokens from the original title
         in the result's name.
+
+        Tokens are compared ignoring punctuation and spacing, and a token
+        which is only partly found, e.g. misspelt, scores by the fraction of
+        its trigrams missing from the name.
         """
+        series = self.metadata.series.lower()
+        compact_series = get_compact_name(series)
+        series_trigrams = get_trigrams(compact_series)
         score = 0
-        for token in parser.get_title_tokens(self.title, self.tokenizer):
-            if token.lower() not in self.metadata.series.lower():
-                score += 10
+        for token, compact_token, trigrams in self.query.token_names:
+            if token in series or \
+                    (compact_token and compact_token in compact_series):
+                continue
+            containment = get_trigram_containment(trigrams, series_trigrams)
+            score += int(round(10 * (1 - containment)))
         return score
 
     def score_title_length(self):
         """
         Prefer input titles which more closely match the canonical title
         """
-        title_tokens = parser.get_title_tokens(self.title, self.tokenizer)
-        input_title = ' '.join(title_tokens).lower().strip()
+        input_title = self.query.sanitized_title
 
         result_title = self.metadata.series.lower().strip()
 
@@ -131,11 +315,9 @@ class IssueScorer(object):
 
         Prefer results which have the series index number in the input title.
         """
-        issue_number = parser.get_issue_number(self.title)
-
-        if issue_number is None:
+        if self.query.issue_number is None:
             return 10
-        elif float(self.metadata.series_index) != float(issue_number):
+        elif float(self.metadata.series_index) != self.query.issue_value:
             return 50
         else:
             return 0
@@ -143,34 +325,22 @@ class IssueScorer(object):
     def score_comments(self):
         """
         De-preference collections.
+
+        Uses the collection_score of the metadata if it has one, see
+        client.Issue.get_collection_score, rather than scanning the
+        comments again.
         """
-        comments = self.metadata.comments
-        if comments:
-            lines = comments.split('\n')
-
-            if has_lines_with_pattern(lines,
-                                      r'(?:collect|contain)(?:s|ing) issues',
-                                      ignore_case=True):
-                # Prefer single-issue results by looking for the phrases
-                # "collecting issues", "collects issues", etc.
-                return 20
-            if has_lines_with_pattern(lines, r'(?:Collect|Contain)(?:s|ing)'):
-                # Penalize sentences starting with "Collecting", "Collects", etc.
-                return 10
-            if comments.find('Translates') != -1 and comments.count("\n") <= 1:
-                # Single line comments with a sentence starting with
-                # "Translates" are usually translated compilations.
-                return 15
-        return 0
+        score = getattr(self.metadata, 'collection_score', None)
+        if score is None:
+            score = score_collection(self.metadata.comments)
+        return score
 
     def get_sanitized_title(self):
         """
         Given the title from the initial input, strip the date out of it,
         lower-case it, and strip off any leading/trailing whitespace.
         """
-        title_tokens = parser.get_title_tokens(self.title, self.tokenizer)
-
-        return ' '.join(title_tokens).lower().strip()
+        return self.query.sanitized_title
 
     def get_sanitized_series(self):
         """
@@ -179,8 +349,34 @@ class IssueScorer(object):
         return self.metadata.series.lower().strip()
 
 
-def has_lines_with_pattern(lines, pattern, ignore_case=False):
-    matcher = re.compile(pattern)
-    lines = [line.lower() if ignore_case else line for line in lines]
-    lines = [line for line in lines if matcher.search(line)]
-    return len(lines) > 0
+# "collects", "containing" etc., in any case, and whether "issues" follows
+COLLECTION_PATTERN = re.compile(
+    r'(?:collect|contain)(?:s|ing)(?P<issues> issues)?', re.IGNORECASE)
+
+COLLECTION_WORDS = frozenset(['Collects', 'Collecting',
+                              'Contains', 'Containing'])
+
+
+def score_collection(comments):
+    """
+    Score how likely comments are to describe a collection, in a single
+    scan of the comments which stops at the first "collects issues".
+    """
+    if not comments:
+        return 0
+    has_collection_word = False
+    for match in COLLECTION_PATTERN.finditer(comments):
+        if match.group('issues'):
+            # Prefer single-issue results by looking for the phrases
+            # "collecting issues", "collects issues", etc.
+            return 20
+        if match.group(0) in COLLECTION_WORDS:
+            has_collection_word = True
+    if has_collection_word:
+        # Penalize sentences starting with "Collecting", "Collects", etc.
+        return 10
+    if comments.find('Translates') != -1 and comments.count("\n") <= 1:
+        # Single line comments with a sentence starting with
+        # "Translates" are usually translated compilations.
+        return 15
+    return 0
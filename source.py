@@ -5,6 +5,7 @@ from functools import partial
 import logging
 from multiprocessing.pool import ThreadPool
 from Queue import Queue
+import sys
 import threading
 
 from calibre import setup_cli_handlers
@@ -13,7 +14,8 @@ from calibre.ebooks.metadata.sources.base import Source
 from calibre.utils.config import OptionParser
 import calibre.utils.logging as calibre_logging
 
-from client import PyComicvineWrapper
+import batch
+from client import build_cache_pack, get_client
 from config import PREFS, ConfigWidget
 import parser
 import ranking
@@ -79,9 +81,68 @@ class Comicvine(Source):
         def option_parser():
             """Parse command line options."""
             option_parser = OptionParser(
-                usage='Comicvine [t:title] [a:authors] [i:id] [-- -v]')
+                usage='Comicvine [t:title] [a:authors] [i:id] '
+                      '[-- -v] [-- --batch FILE]')
             option_parser.add_option('--opf', '-o', action='store_true',
                                      dest='opf')
+            option_parser.add_option('--batch', '-b', dest='batch',
+                                     help='identify every title in FILE, '
+                                          'one per line, or - for stdin, '
+                                          'writing JSON lines to stdout')
+            option_parser.add_option('--journal', '-j', dest='journal',
+                                     help='record batch progress in JOURNAL, '
+                                          'and skip titles it records as '
+                                          'finished')
+            option_parser.add_option('--processes', '-p', dest='processes',
+                                     type='int', default=1,
+                                     help='identify batch titles in this '
+                                          'many processes')
+            option_parser.add_option('--mirror-volume', dest='mirror_volumes',
+                                     action='append', type='int', default=[],
+                                     help='store a volume and its issues in '
+                                          'the local mirror')
+            option_parser.add_option('--mirror-publisher',
+                                     dest='mirror_publishers',
+                                     action='append', type='int', default=[],
+                                     help='store all volumes of a publisher '
+                                          'in the local mirror')
+            option_parser.add_option('--mirror-cache', dest='mirror_cache',
+                                     action='store_true', default=False,
+                                     help='store all cached volumes and '
+                                          'issues in the local mirror')
+            option_parser.add_option('--mirror-details', dest='mirror_details',
+                                     action='store_true', default=False,
+                                     help='also fetch descriptions and '
+                                          'credits of mirrored issues')
+            option_parser.add_option('--mirror-sync', dest='mirror_sync',
+                                     action='store_true', default=False,
+                                     help='update mirrored volumes and '
+                                          'issues changed since the last '
+                                          'sync')
+            option_parser.add_option('--warm-series', dest='warm_series',
+                                     action='append', default=[],
+                                     help='prefetch the volumes found by '
+                                          'a series name into the cache')
+            option_parser.add_option('--warm-volume', dest='warm_volumes',
+                                     action='append', type='int', default=[],
+                                     help='prefetch a volume and its '
+                                          'issues into the cache')
+            option_parser.add_option('--warm-publisher',
+                                     dest='warm_publishers',
+                                     action='append', type='int', default=[],
+                                     help='prefetch all volumes of a '
+                                          'publisher into the cache')
+            option_parser.add_option('--warm-titles', dest='warm_titles',
+                                     help='prefetch the lookups to identify '
+                                          'each title in a batch file')
+            option_parser.add_option('--warm-details', dest='warm_details',
+                                     action='store_true', default=False,
+                                     help='also prefetch the full details '
+                                          'of every warmed issue')
+            option_parser.add_option('--build-cache-pack', dest='cache_pack',
+                                     help='write the file cache and the '
+                                          'local mirror to a cache pack '
+                                          'file')
             option_parser.add_option('--verbose', '-v', default=False,
                                      action='store_true', dest='verbose')
             return option_parser
@@ -90,6 +151,32 @@ class Comicvine(Source):
 
         log = init_cli_logging(opts.verbose)
 
+        if opts.mirror_volumes or opts.mirror_publishers or \
+                opts.mirror_cache or opts.mirror_sync:
+            self.run_mirror(log, opts)
+            return
+
+        if opts.warm_series or opts.warm_volumes or opts.warm_publishers or \
+                opts.warm_titles:
+            titles = []
+            if opts.warm_titles:
+                with open(opts.warm_titles) as titles_file:
+                    titles = [batch_input.title for batch_input in
+                              batch.read_batch_inputs(titles_file)]
+            self.warm_cache(log, opts.warm_series, opts.warm_volumes,
+                            opts.warm_publishers, titles, opts.warm_details)
+            return
+
+        if opts.cache_pack:
+            count = build_cache_pack(opts.cache_pack, get_client(log).mirror)
+            log.info('Wrote %d entries to cache pack: %s' %
+                     (count, opts.cache_pack))
+            return
+
+        if opts.batch:
+            self.run_batch(log, opts.batch, opts.journal, opts.processes)
+            return
+
         title = None
         authors = []
         identifiers = {}
@@ -110,15 +197,81 @@ class Comicvine(Source):
                       authors=authors,
                       identifiers=identifiers)
         rank = self.identify_results_keygen(title, authors, identifiers)
-        for result in sorted(result_queue.queue, key=rank):
+        ranker = ranking.TopResults(
+            self.get_ranking_query(title, authors, identifiers),
+            limit=1 if opts.opf else None)
+        for result in result_queue.queue:
+            ranker.add(result)
+        for result in ranker.results():
             self._print_result(result, rank, opf=opts.opf)
-            if opts.opf:
-                break
 
-    def enqueue(self, log, result_queue, shutdown, issue_id):
-        """Add a result entry to the result queue."""
+    def run_batch(self, log, path, journal_path=None, processes=1):
+        """
+        Identify every title in the batch file, or stdin for '-',
+        optionally checkpointing progress in a journal file.
+        """
+        if path == '-':
+            inputs = batch.read_batch_inputs(sys.stdin)
+        else:
+            with open(path) as batch_file:
+                inputs = batch.read_batch_inputs(batch_file)
+        journal = batch.BatchJournal(journal_path) if journal_path else None
+        try:
+            identifier = batch.BatchIdentifier(self, log, journal, processes)
+            identifier.run(inputs, sys.stdout)
+        finally:
+            if journal is not None:
+                journal.close()
+
+    def run_mirror(self, log, opts):
+        """Populate the local mirror, as requested by the cli options."""
+        client = get_client(log)
+        if client.mirror is None:
+            log.error('No mirror database file is configured')
+            return
+        if opts.mirror_cache:
+            client.mirror_cached()
+        for publisher_id in opts.mirror_publishers:
+            client.mirror_publisher(publisher_id, opts.mirror_details)
+        for volume_id in opts.mirror_volumes:
+            client.mirror_volume(volume_id, opts.mirror_details)
+        if opts.mirror_sync:
+            client.sync_mirror()
+
+    def warm_cache(self, log, series_names=(), volume_ids=(),
+                   publisher_ids=(), titles=(), details=False):
+        """
+        Prefetch into the cache the lookups needed to identify issues of
+        the named series, volumes and publishers, and to identify each of
+        the titles, e.g. ahead of adding new books to the library.
+        """
+        client = get_client(log)
+        volume_ids = list(volume_ids)
+        for series_name in series_names:
+            title_tokens = parser.get_title_tokens(series_name,
+                                                   self.get_title_tokens)
+            volume_ids.extend(volume.id for volume in
+                              utils.find_volumes(title_tokens, log))
+        for publisher_id in publisher_ids:
+            volume_ids.extend(client.list_publisher_volume_ids(publisher_id))
+        if volume_ids:
+            client.warm_volumes(volume_ids, details)
+
+        for title in titles:
+            log.info('Warming: %s' % title)
+            self.identify(log, Queue(), abort=False, title=title)
+
+    def enqueue(self, log, result_queue, shutdown, issue_id, ranker=None):
+        """
+        Add a result entry to the result queue, and return it.
+
+        With a ranking.TopResults ranker, the result is also ranked, and
+        once the ranker is done the shutdown event is set, so that the
+        lookups not yet started are skipped. Returns None for those.
+        """
         if shutdown.is_set():
-            raise threading.ThreadError
+            log.debug('Skipping Issue(%d)' % issue_id)
+            return None
         log.debug('Adding Issue(%d) to queue' % issue_id)
         metadata = utils.build_meta(log, issue_id)
         if metadata:
@@ -126,6 +279,33 @@ class Comicvine(Source):
             with self._qlock:
                 result_queue.put(metadata)
             log.debug('Added Issue(%s) to queue' % metadata.title)
+            if ranker is not None:
+                ranker.add(metadata)
+                if ranker.is_done() and not shutdown.is_set():
+                    log.debug('Issue(%d) is a good enough match, skipping '
+                              'the remaining candidates' % issue_id)
+                    shutdown.set()
+        return metadata
+
+    def get_ranking_query(self, title=None, authors=None, identifiers=None):
+        """Parse an identify query for ranking its results."""
+        return ranking.QueryContext(title=title,
+                                    tokenizer=self.get_title_tokens,
+                                    authors=authors,
+                                    identifiers=identifiers)
+
+    def get_ranker(self, ranking_query):
+        """
+        Make a ranking.TopResults for identify results, which is done at
+        the first result scoring the stop match score or better, or at a
+        confident match, if either is enabled.
+        """
+        stop_score = PREFS['stop_match_score']
+        confident_score = PREFS['confident_match_score']
+        return ranking.TopResults(
+            ranking_query,
+            stop_score=stop_score if stop_score >= 0 else None,
+            confident_score=confident_score if confident_score >= 0 else None)
 
     def identify_results_keygen(self, title=None, authors=None,
                                 identifiers=None):
@@ -135,10 +315,8 @@ class Comicvine(Source):
         Used by Calibre to sort results.
         """
         return partial(ranking.keygen,
-                       title=title,
-                       title_tokens_function=self.get_title_tokens,
-                       authors=authors,
-                       identifiers=identifiers)
+                       query=self.get_ranking_query(title, authors,
+                                                    identifiers))
 
     def identify(self, log, result_queue, abort,
                  title=None, authors=None, identifiers=None, timeout=30):
@@ -165,6 +343,15 @@ class Comicvine(Source):
             title_tokens = parser.get_title_tokens(title, self.get_title_tokens)
             issue_number = parser.get_issue_number(title)
 
+            query = utils.get_identify_query(title_tokens, issue_number,
+                                             parser.get_year(title),
+                                             authors, identifiers)
+            issue_ids = utils.find_cached_issue_ids(query)
+            if issue_ids is not None:
+                log.debug('Using cached identify result: %s' % issue_ids)
+                self.enqueue_all(log, result_queue, issue_ids)
+                return None
+
             # Look up candidate volume IDs based on title
             candidate_volumes = utils.find_volumes(title_tokens,
                                                    log,
@@ -176,22 +363,85 @@ class Comicvine(Source):
                                              issue_number,
                                              log)
 
-            # Queue candidates
-            pool = ThreadPool(PREFS.get('worker_threads'))
-            shutdown = threading.Event()
-            enqueue = partial(self.enqueue, log, result_queue, shutdown)
-            try:
-                pool.map(enqueue, issue_ids)
-            finally:
-                shutdown.set()
+            ranking_query = self.get_ranking_query(title, authors,
+                                                   identifiers)
+            rank = partial(ranking.keygen, query=ranking_query)
+
+            detail_ids = self.select_detail_ids(log, issue_ids, rank)
+            if detail_ids is issue_ids:
+                summary_ids = []
+            else:
+                summary_ids = issue_ids
+
+            # Queue candidates, stopping early if enabled, see get_ranker
+            ranker = self.get_ranker(ranking_query)
+            self.enqueue_all(log, result_queue, detail_ids, ranker)
+
+            ranked_ids = [int(result.identifiers['comicvine'])
+                          for result in ranker.results()]
+            if volume_id:
+                client_calls = [('lookup_volume', (int(volume_id),))]
+            else:
+                client_calls = [('search_for_volumes', (title_tokens,))]
+            client_calls.append(('search_for_issue_ids',
+                                 (candidate_volume_ids, issue_number)))
+            client_calls.extend(('lookup_issue_summary', (issue_id,))
+                                for issue_id in summary_ids)
+            client_calls.extend(('lookup_issue', (issue_id,))
+                                for issue_id in ranked_ids)
+            utils.cache_issue_ids(query, ranked_ids, client_calls, log)
 
         return None
 
+    def enqueue_all(self, log, result_queue, issue_ids, ranker=None):
+        """
+        Look up the issues in parallel, adding each one to the result queue,
+        and to the ranker if any, see enqueue.
+
+        Returns the list of results found.
+        """
+        shutdown = threading.Event()
+        enqueue = partial(self.enqueue, log, result_queue, shutdown,
+                          ranker=ranker)
+        try:
+            results = map_in_pool(enqueue, issue_ids)
+        finally:
+            shutdown.set()
+        return [result for result in results if result is not None]
+
+    def select_detail_ids(self, log, issue_ids, rank):
+        """
+        Select the candidate issues to fetch in full.
+
+        If there are more candidates than the detail lookup limit, rank
+        them on summaries, so that full details are only fetched for the
+        best few. Otherwise, return issue_ids unchanged.
+        """
+        detail_limit = PREFS['detail_lookup_limit']
+        if len(issue_ids) <= detail_limit:
+            return issue_ids
+        summaries = self.find_summaries(log, issue_ids)
+        ranked_ids = [int(summary.identifiers['comicvine'])
+                      for summary in sorted(summaries, key=rank)]
+        return ranked_ids[:detail_limit]
+
+    def find_summaries(self, log, issue_ids):
+        """
+        Find issue summaries for ranking candidates, listing the uncached
+        ones in as few requests as possible.
+
+        Returns the list of summary results found.
+        """
+        summaries = utils.build_summary_metas(log, issue_ids)
+        for metadata in summaries:
+            self.clean_downloaded_metadata(metadata)
+        return summaries
+
     def download_cover(self, log, result_queue, abort,
                        title=None, authors=None, identifiers=None,
                        timeout=30, get_best_cover=False):
         if identifiers and 'comicvine' in identifiers:
-            client = PyComicvineWrapper(log)
+            client = get_client(log)
             comicvine_id = int(identifiers['comicvine'])
             issue = client.lookup_issue(comicvine_id)
 
@@ -209,6 +459,15 @@ class Comicvine(Source):
                     log.exception('Failed to download cover from:', url)
 
 
+def map_in_pool(function, items):
+    """Map the function over the items using the worker thread pool."""
+    pool = ThreadPool(PREFS.get('worker_threads'))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+
+
 def init_cli_logging(is_verbose=True):
     if is_verbose:
         calibre_logging.default_log = \
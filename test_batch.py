@@ -0,0 +1,192 @@
+"""
+Unit tests for the batch module.
+"""
+import json
+import logging
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+import time
+import unittest
+
+import batch
+from batch import (BatchIdentifier, BatchJournal, BatchProgress,
+                   read_batch_inputs)
+from config import PREFS
+
+
+class MockPlugin(object):
+    def get_title_tokens(self, title):
+        return title.split()
+
+
+class MockIdentifier(BatchIdentifier):
+    """Identifies each input as itself, recording the inputs identified."""
+
+    def __init__(self, *args, **kwargs):
+        BatchIdentifier.__init__(self, *args, **kwargs)
+        self.identified = []
+
+    def identify_group(self, title_tokens, group_inputs):
+        self.identified.extend(batch_input.line
+                               for batch_input in group_inputs)
+        return [(batch_input, {'input': batch_input.line}, 2)
+                for batch_input in group_inputs]
+
+
+class TestBatchInputs(unittest.TestCase):
+    def test_read_batch_inputs(self):
+        inputs = read_batch_inputs(['12|Dogville #2\n', '\n',
+                                    'Catville #1\r\n', '1a|Dogville #3'])
+        self.assertEqual([(0, '12', u'Dogville #2'),
+                          (1, None, u'Catville #1'),
+                          (2, None, u'1a|Dogville #3')],
+                         [(batch_input.index, batch_input.expected_id,
+                           batch_input.title) for batch_input in inputs])
+
+
+class TestBatchProcesses(unittest.TestCase):
+    def setUp(self):
+        self.can_fork_processes = batch.can_fork_processes
+
+    def tearDown(self):
+        batch.can_fork_processes = self.can_fork_processes
+
+    def test_processes_need_fork(self):
+        batch.can_fork_processes = lambda: False
+        identifier = MockIdentifier(MockPlugin(),
+                                    logging.getLogger('test_batch'),
+                                    processes=4)
+        self.assertEqual(1, identifier.processes)
+
+        batch.can_fork_processes = lambda: True
+        identifier = MockIdentifier(MockPlugin(),
+                                    logging.getLogger('test_batch'),
+                                    processes=4)
+        self.assertEqual(4, identifier.processes)
+
+
+class TestBatchJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'batch.journal')
+        self.inputs = read_batch_inputs(['Dogville #1', 'Dogville #2',
+                                         'Catville #1'])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_journal(self, entries, tail=''):
+        with open(self.path, 'w') as journal_file:
+            for entry in entries:
+                journal_file.write(json.dumps(entry) + '\n')
+            journal_file.write(tail)
+
+    def test_replay(self):
+        now = time.time()
+        self.write_journal([
+            {'event': 'started', 'input': 'Dogville #1'},
+            {'event': 'finished', 'input': 'Dogville #1',
+             'result': {'comicvine': '1'}, 'requests': 3, 'time': now - 7200},
+            {'event': 'started', 'input': 'Dogville #2'},
+            {'event': 'started', 'input': 'Catville #1'},
+            {'event': 'finished', 'input': 'Catville #1',
+             'result': {'comicvine': '3'}, 'requests': 4, 'time': now},
+        ], tail='{"event": "finished", "input": "Dogville #2", "res')
+        journal = BatchJournal(self.path)
+        journal.close()
+
+        self.assertEqual([True, False, True],
+                         [journal.is_finished(batch_input)
+                          for batch_input in self.inputs])
+        self.assertEqual([False, True, False],
+                         [journal.is_in_flight(batch_input)
+                          for batch_input in self.inputs])
+        self.assertEqual({'comicvine': '3'}, journal.finished['Catville #1'])
+        self.assertEqual(7, journal.get_requests_since(now - 10000))
+        self.assertEqual(4, journal.get_requests_since(now - 3600))
+
+    def test_write_and_replay(self):
+        journal = BatchJournal(self.path)
+        journal.start(self.inputs[0])
+        journal.start(self.inputs[1])
+        journal.finish(self.inputs[0], {'comicvine': '1'}, 5)
+        journal.close()
+
+        journal = BatchJournal(self.path)
+        journal.close()
+        self.assertEqual(True, journal.is_finished(self.inputs[0]))
+        self.assertEqual(False, journal.is_in_flight(self.inputs[0]))
+        self.assertEqual(True, journal.is_in_flight(self.inputs[1]))
+        self.assertEqual(5, journal.get_requests_since(0))
+
+    def test_run_skips_finished_inputs(self):
+        self.write_journal([
+            {'event': 'started', 'input': 'Dogville #1'},
+            {'event': 'finished', 'input': 'Dogville #1',
+             'result': {'comicvine': '1'}, 'requests': 3,
+             'time': time.time()},
+            {'event': 'started', 'input': 'Dogville #2'},
+        ])
+        journal = BatchJournal(self.path)
+        identifier = MockIdentifier(MockPlugin(),
+                                    logging.getLogger('test_batch'), journal)
+        output = StringIO()
+        identifier.run(self.inputs, output)
+        journal.close()
+
+        self.assertEqual(['Dogville #2', 'Catville #1'],
+                         identifier.identified)
+        self.assertEqual([{'comicvine': '1'}, {'input': 'Dogville #2'},
+                          {'input': 'Catville #1'}],
+                         [json.loads(line)
+                          for line in output.getvalue().splitlines()])
+
+        journal = BatchJournal(self.path)
+        journal.close()
+        self.assertEqual([True, True, True],
+                         [journal.is_finished(batch_input)
+                          for batch_input in self.inputs])
+        self.assertEqual(set(), journal.started)
+
+
+class TestBatchProgress(unittest.TestCase):
+    def test_quota_left(self):
+        progress = BatchProgress(10)
+        progress.update(3)
+        progress.update(4)
+        self.assertEqual(8, progress.remaining)
+        self.assertEqual(max(PREFS['hourly_request_quota'] - 7, 0),
+                         progress.get_quota_left())
+
+        progress.update(PREFS['hourly_request_quota'])
+        self.assertEqual(0, progress.get_quota_left())
+
+    def test_eta_unknown(self):
+        self.assertEqual(None, BatchProgress(10).get_eta())
+
+    def test_eta_by_throughput(self):
+        progress = BatchProgress(9)
+        progress.update(0)
+        progress.update(0)
+        progress.start_time = time.time() - 100
+        # 50 seconds per title, without any requests
+        self.assertAlmostEqual(350, progress.get_eta(), delta=1)
+
+    def test_eta_by_request_rate(self):
+        progress = BatchProgress(11)
+        progress.update(1)
+        progress.start_time = time.time() - 1
+        self.assertAlmostEqual(10 * PREFS['request_interval'],
+                               progress.get_eta(), delta=1)
+
+    def test_eta_over_quota(self):
+        quota = PREFS['hourly_request_quota']
+        progress = BatchProgress(3)
+        progress.update(quota)
+        progress.start_time = time.time() - 1
+        # the remaining titles need twice the quota, after this hour's
+        self.assertAlmostEqual(
+            max(2 * quota * PREFS['request_interval'], 3 * 3600),
+            progress.get_eta(), delta=1)
@@ -0,0 +1,473 @@
+"""
+Unit tests for the client module.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from urllib2 import HTTPError
+
+import client
+from client import (ClientSettings, count_ids_within_url_length,
+                    get_id_filter_url_length, get_issue_search_key,
+                    get_lookup_key, get_volume_search_key, PyComicvineWrapper,
+                    ResultCache)
+import pycomicvine
+import pyfscache
+
+# the resource types of the mock responses, as listed by Comicvine
+RESOURCE_TYPES = [
+    (4000, 'issue', 'issues'),
+    (4040, 'person', 'people'),
+    (4010, 'publisher', 'publishers'),
+    (4050, 'volume', 'volumes'),
+]
+
+VOLUMES = {
+    77: {'id': 77, 'name': u'Dogville', 'start_year': u'1999',
+         'publisher': {'id': 10, 'name': u'Dog Comics'}},
+    78: {'id': 78, 'name': u'Catville', 'start_year': u'2001',
+         'publisher': {'id': 11, 'name': u'Cat Comics'}},
+}
+
+
+def mock_issue_fields(issue_id, volume_id, issue_number):
+    return {'id': issue_id, 'name': u'Issue %d' % issue_id,
+            'issue_number': issue_number,
+            'volume': {'id': volume_id,
+                       'name': VOLUMES[volume_id]['name']},
+            'store_date': None, 'cover_date': u'2000-01-02',
+            'image': {'super_url': u'http://example.com/%d.jpg' % issue_id},
+            'description': u'<p>Rex and Fido.</p>',
+            'person_credits': [{'id': 5, 'name': u'Rex'}]}
+
+
+ISSUES = {
+    1: mock_issue_fields(1, 77, u'1'),
+    2: mock_issue_fields(2, 77, u'2'),
+    3: mock_issue_fields(3, 78, u'1'),
+}
+
+
+class FreeTokenBucket(object):
+    """A token bucket which never waits, counting the tokens consumed."""
+
+    def __init__(self):
+        self.consumed = 0
+
+    def consume(self):
+        self.consumed += 1
+
+    def try_consume(self, reserve=0):
+        self.consumed += 1
+        return True
+
+
+class MockIssue(object):
+    def __init__(self, issue_id):
+        self.id = issue_id
+
+
+def mock_list_resource(max_ids=None):
+    """
+    Make a list resource type listing one issue per ID of its filter, and
+    recording the IDs of each request. Requests for more than max_ids IDs
+    are rejected as too long.
+    """
+
+    class Issues(object):
+        requests = []
+        offsets = []
+
+        def __init__(self, filter, field_list, offset, limit):
+            ids = [int(an_id) for an_id in
+                   filter.split(',')[0].partition(':')[2].split('|')]
+            Issues.requests.append(ids)
+            Issues.offsets.append(offset)
+            if max_ids is not None and len(ids) > max_ids:
+                raise HTTPError('http://comicvine', 414,
+                                'Request-URI Too Long', None, None)
+            self.issues = [MockIssue(an_id) for an_id in ids]
+            self.offset = offset
+            self.limit = limit
+
+        def __len__(self):
+            return len(self.issues)
+
+        def __getitem__(self, index):
+            # pycomicvine would request any other page itself
+            if not self.offset <= index < self.offset + self.limit:
+                raise AssertionError('Page of %d not requested' % index)
+            return self.issues[index]
+
+    return Issues
+
+
+class MockComicvine(object):
+    """
+    Answers pycomicvine requests for VOLUMES and ISSUES, recording the
+    resource and the filter or query of each request.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def install(self):
+        """Answer pycomicvine's requests, until uninstalled."""
+        self.request_method = pycomicvine._Resource.__dict__['_request']
+        pycomicvine._Resource._request = classmethod(
+            lambda resource_type, url, **params: self.request(url, **params))
+        types = object.__new__(pycomicvine.Types)
+        types._mapping = {}
+        for type_id, detail_name, list_name in RESOURCE_TYPES:
+            resource_type = {
+                'id': type_id,
+                'detail_resource_name': detail_name,
+                'list_resource_name': list_name,
+                'singular_resource_class': getattr(
+                    pycomicvine,
+                    pycomicvine.Types._camilify_type_name(detail_name)),
+            }
+            types._mapping[detail_name] = resource_type
+            types._mapping[list_name] = resource_type
+        types._ready = True
+        pycomicvine.Types._instance = types
+        pycomicvine._cached_resources.clear()
+
+    def uninstall(self):
+        pycomicvine._Resource._request = self.request_method
+        pycomicvine._cached_resources.clear()
+
+    def request(self, url, field_list=None, filter=None, offset=0, limit=100,
+                **params):
+        resource = url[len(pycomicvine._API_URL):].strip('/')
+        self.requests.append((resource, filter or params.get('query')))
+        if resource.startswith('volume/'):
+            results = select_fields(
+                VOLUMES.get(int(resource.rpartition('-')[2])), field_list)
+            return pycomicvine._Resource._Response(None, 1, 0, 1, 1, 1,
+                                                   results)
+        elif resource.startswith('issue/'):
+            results = select_fields(
+                ISSUES.get(int(resource.rpartition('-')[2])), field_list)
+            return pycomicvine._Resource._Response(None, 1, 0, 1, 1, 1,
+                                                   results)
+        elif resource == 'search':
+            terms = params['query'].lower().split(' and ')
+            results = [dict(select_fields(VOLUMES[volume_id], field_list),
+                            resource_type='volume')
+                       for volume_id in sorted(VOLUMES)
+                       if all(term in VOLUMES[volume_id]['name'].lower()
+                              for term in terms)]
+            return pycomicvine._Resource._Response(None, limit, offset,
+                                                   len(results), len(results),
+                                                   1, results)
+        elif resource in ('issues', 'volumes'):
+            resources = ISSUES if resource == 'issues' else VOLUMES
+            matches = [select_fields(resources[resource_id], field_list)
+                       for resource_id in sorted(resources)
+                       if matches_filter(resources[resource_id], filter)]
+            page = matches[offset:offset + limit]
+            return pycomicvine._Resource._Response(None, limit, offset,
+                                                   len(page), len(matches),
+                                                   1, page)
+        raise AssertionError('Unexpected request: %s' % url)
+
+
+def select_fields(fields, field_list):
+    if fields is None:
+        return None
+    return dict((name, value) for (name, value) in fields.items()
+                if not field_list or name in field_list)
+
+
+def matches_filter(fields, filter_string):
+    """
+    Match an 'id' or 'volume' filter, e.g. 'volume:77|78'. Every resource
+    matches other filters, such as date ranges.
+    """
+    for condition in filter_string.split(','):
+        name, _, values = condition.partition(':')
+        if name == 'volume':
+            value = fields['volume']['id']
+        elif name == 'id':
+            value = fields['id']
+        else:
+            continue
+        if str(value) not in values.split('|'):
+            return False
+    return True
+
+
+class TemporaryCaches(object):
+    """
+    Moves the client's file caches to a temporary directory, until
+    uninstalled, so that tests neither read nor write the user's caches.
+    """
+
+    def install(self):
+        self.directory = tempfile.mkdtemp()
+        self.temp_directory = os.environ.get('TMPDIR')
+        os.environ['TMPDIR'] = self.directory
+        self.moved = []
+        for cache in get_file_caches():
+            path = os.path.join(self.directory, 'calibre-comicvine',
+                                os.path.basename(cache._path))
+            os.makedirs(path)
+            self.moved.append((cache, cache._path, cache._loaded))
+            cache._path = path
+            cache._loaded = {}
+
+    def uninstall(self):
+        for cache, path, loaded in self.moved:
+            cache._path = path
+            cache._loaded = loaded
+        if self.temp_directory is None:
+            del os.environ['TMPDIR']
+        else:
+            os.environ['TMPDIR'] = self.temp_directory
+        shutil.rmtree(self.directory)
+
+
+def get_file_caches():
+    """
+    Return the file caches of the client's cached methods and result
+    caches, which exist only if TMPDIR was set when client was imported.
+    """
+    caches = [getattr(method, 'cache', None) for method in
+              vars(PyComicvineWrapper).values()]
+    caches.extend(getattr(value, 'cache', None) for value in
+                  vars(client).values() if isinstance(value, ResultCache))
+    return [cache for cache in caches if cache is not None]
+
+
+def mock_client(max_url_length=2000, mirror_path='',
+                local_volume_search=False):
+    return PyComicvineWrapper(ClientSettings(
+        api_key='key',
+        cache_hours=12,
+        max_attempts=1,
+        max_url_length=max_url_length,
+        search_volume_limit=100,
+        mirror_path=mirror_path,
+        local_volume_search=local_volume_search,
+        prefetch_neighbors=0))
+
+
+class TestCacheKeys(unittest.TestCase):
+    def assertSameKey(self, key, other_key):
+        self.assertEqual(key, other_key)
+        self.assertEqual(pyfscache.make_digest(key),
+                         pyfscache.make_digest(other_key))
+
+    def test_get_lookup_key(self):
+        self.assertEqual((1, 12), get_lookup_key(12))
+        self.assertSameKey(get_lookup_key(12), get_lookup_key('12'))
+        self.assertSameKey(get_lookup_key(12), get_lookup_key(12L))
+
+    def test_get_issue_search_key(self):
+        self.assertEqual((1, (3, 12), u'2'),
+                         get_issue_search_key([12, 3], '2'))
+        self.assertSameKey(get_issue_search_key([12, 3], '2'),
+                           get_issue_search_key(['3', 12, 3], u'2'))
+        self.assertSameKey(get_issue_search_key([3], u'\xbd'),
+                           get_issue_search_key([3], '\xc2\xbd'))
+        self.assertEqual((1, (3,), None), get_issue_search_key([3], None))
+
+    def test_get_volume_search_key(self):
+        self.assertEqual((1, (u'dogville', u'man')),
+                         get_volume_search_key(['Man', 'dogville', 'man']))
+        self.assertSameKey(get_volume_search_key(['man', 'dogville']),
+                           get_volume_search_key([u'Dogville', u'MAN']))
+        self.assertSameKey(get_volume_search_key(['caf\xc3\xa9']),
+                           get_volume_search_key([u'Caf\xe9']))
+
+
+class TestUrlLength(unittest.TestCase):
+    def test_count_ids_within_url_length(self):
+        # 1 -> 11, '|' is encoded as '%7C', 22 -> 16, 333 -> 22
+        ids = [1, 22, 333]
+        self.assertEqual(3, count_ids_within_url_length(ids, 10, 22))
+        self.assertEqual(2, count_ids_within_url_length(ids, 10, 21))
+        self.assertEqual(2, count_ids_within_url_length(ids, 10, 16))
+        self.assertEqual(1, count_ids_within_url_length(ids, 10, 15))
+
+    def test_count_ids_always_at_least_one(self):
+        self.assertEqual(1, count_ids_within_url_length([1, 2], 10, 10))
+        self.assertEqual(1, count_ids_within_url_length([1, 2], 100, 10))
+        self.assertEqual(0, count_ids_within_url_length([], 10, 10))
+
+
+class TestListByIds(unittest.TestCase):
+    def setUp(self):
+        self.token_bucket = client._token_bucket
+        client._token_bucket = FreeTokenBucket()
+
+    def tearDown(self):
+        client._token_bucket = self.token_bucket
+
+    def test_ids_packed_within_url_length(self):
+        issues_type = mock_list_resource()
+        comicvine = mock_client()
+        comicvine.max_url_length = get_id_filter_url_length(
+            issues_type, 'volume', [10, 11], [], ['id'])
+        issues = comicvine.list_by_ids(issues_type, 'volume', range(10, 15),
+                                       [], ['id'])
+
+        self.assertEqual([[10, 11], [12, 13], [14]], issues_type.requests)
+        self.assertEqual(range(10, 15), [issue.id for issue in issues])
+
+    def test_url_length_lowered_after_rejection(self):
+        issues_type = mock_list_resource(max_ids=2)
+        issues = mock_client(100000).list_by_ids(
+            issues_type, 'volume', range(10, 15), [], ['id'])
+
+        self.assertEqual([range(10, 15), range(10, 14), range(10, 13),
+                          [10, 11], [12, 13], [14]], issues_type.requests)
+        self.assertEqual(range(10, 15), [issue.id for issue in issues])
+
+    def test_pages_are_requested(self):
+        issues_type = mock_list_resource()
+        issues = mock_client(100000).list_by_ids(
+            issues_type, 'volume', range(1000, 1250), [], ['id'])
+
+        self.assertEqual([0, 100, 200], issues_type.offsets)
+        self.assertEqual(range(1000, 1250), [issue.id for issue in issues])
+        self.assertEqual(3, client._token_bucket.consumed)
+
+    def test_single_id_rejection_is_raised(self):
+        issues_type = mock_list_resource(max_ids=0)
+        with self.assertRaises(HTTPError):
+            mock_client(100000).list_by_ids(issues_type, 'volume', [10, 11],
+                                            [], ['id'])
+        self.assertEqual([[10, 11], [10]], issues_type.requests)
+
+
+class TestComicvineRequests(unittest.TestCase):
+    def setUp(self):
+        self.token_bucket = client._token_bucket
+        client._token_bucket = FreeTokenBucket()
+        self.caches = TemporaryCaches()
+        self.caches.install()
+        self.comicvine = MockComicvine()
+        self.comicvine.install()
+        self.client = mock_client()
+
+    def tearDown(self):
+        self.comicvine.uninstall()
+        self.caches.uninstall()
+        client._token_bucket = self.token_bucket
+
+    def test_find_issue_summaries_lists_by_id(self):
+        summaries = self.client.find_issue_summaries([3, 99, 1, 2])
+
+        self.assertEqual([3, 1, 2], [summary.id for summary in summaries])
+        self.assertEqual([(u'Issue 3', 1, False, None),
+                          (u'Issue 1', 1, False, None),
+                          (u'Issue 2', 2, False, None)],
+                         [(summary.name, summary.issue_number,
+                           summary.has_details, summary.description)
+                          for summary in summaries])
+        self.assertEqual([('issues', 'id:3|99|1|2')],
+                         [request for request in self.comicvine.requests
+                          if request[0] == 'issues'])
+
+    def test_mirrored_summaries_are_cached(self):
+        comicvine = mock_client(mirror_path=':memory:')
+        comicvine.mirror.store_issue(client.Issue.from_record(
+            dict(ISSUES[3], volume_id=78, volume_name=u'Catville',
+                 publisher_name=u'Cat Comics', has_details=False,
+                 description=None, author_names=[], image_urls=[],
+                 date=None)).to_record())
+        summaries = comicvine.find_issue_summaries([3])
+
+        self.assertEqual([u'Issue 3'], [summary.name for summary in summaries])
+        self.assertEqual([], self.comicvine.requests)
+        self.assertEqual(bool(get_file_caches()),
+                         comicvine.is_cached('lookup_issue_summary', 3))
+        comicvine.mirror.close()
+
+    @unittest.skipUnless(get_file_caches(),
+                         'searches are only recorded in the file cache')
+    def test_recent_searches_answered_locally(self):
+        volumes = mock_client(local_volume_search=True).search_for_volumes(
+            [u'Dogville'])
+        self.assertEqual([77], [volume.id for volume in volumes])
+
+        # a new process, so only the file cache is shared
+        comicvine = mock_client(local_volume_search=True)
+        volumes = comicvine.search_for_volumes([u'Catville'])
+        self.assertEqual([78], [volume.id for volume in volumes])
+        self.assertEqual(None, comicvine.volume_index)
+
+        volumes = comicvine.search_for_volumes([u'DOGVILLE!'])
+        self.assertEqual([77], [volume.id for volume in volumes])
+        self.assertEqual([u'Dogville', u'Catville'],
+                         [query for resource, query in
+                          self.comicvine.requests if resource == 'search'])
+
+    def test_find_volumes_by_ids(self):
+        volumes = self.client.find_volumes_by_ids([78, 99, 77])
+
+        self.assertEqual([(78, u'Catville', u'Cat Comics'),
+                          (77, u'Dogville', u'Dog Comics')],
+                         [(volume.id, volume.name, volume.publisher_name)
+                          for volume in volumes])
+        self.assertEqual([('volumes', 'id:78|99|77')],
+                         self.comicvine.requests)
+
+    def test_warm_volumes_lists_by_id(self):
+        self.client.warm_volumes([78, 77, 99, 78])
+
+        self.assertEqual([('volumes', 'id:77|78|99')],
+                         [request for request in self.comicvine.requests
+                          if request[0].startswith('volume')])
+
+    def test_sync_mirror_refetches_details(self):
+        comicvine = mock_client(mirror_path=':memory:')
+        stale_issue = client.Issue.from_record(
+            dict(ISSUES[1], volume_id=77, volume_name=u'Dogville',
+                 publisher_name=u'Dog Comics', name=u'Stale',
+                 description=u'Stale', has_details=True, author_names=[],
+                 image_urls=[], date=None))
+        comicvine.mirror.store_volume_issues(
+            {'id': 77, 'name': u'Dogville', 'start_year': 1999,
+             'publisher_name': u'Dog Comics'},
+            [stale_issue.to_record()])
+        # stored from search results, so not answered by the mirror
+        comicvine.mirror.store_volume(
+            {'id': 78, 'name': u'Catville', 'start_year': 2001,
+             'publisher_name': u'Cat Comics'})
+        comicvine.mirror.set_watermark_if_missing(client.SYNC_WATERMARK,
+                                                  '2016-01-01 00:00:00')
+        comicvine.sync_mirror()
+
+        record = comicvine.mirror.get_issue(1)
+        self.assertEqual((u'Issue 1', u'<p>Rex and Fido.</p>', [u'Rex']),
+                         (record['name'], record['description'],
+                          record['author_names']))
+        self.assertEqual(u'Issue 2', comicvine.mirror.get_issue(
+            2, details=False)['name'])
+        self.assertIn(('issue/4000-1', None), self.comicvine.requests)
+        self.assertEqual(['id:77', 'volume:77'],
+                         [filter.split(',')[0] for resource, filter
+                          in self.comicvine.requests if filter])
+        comicvine.mirror.close()
+
+    def test_issue_lookup_keeps_volume_publisher(self):
+        issue = self.client.lookup_issue(1)
+        volume = self.client.lookup_volume(77)
+
+        self.assertEqual(u'Dog Comics', issue.publisher_name)
+        self.assertEqual((u'Dogville', 1999, u'Dog Comics'),
+                         (volume.name, volume.start_year,
+                          volume.publisher_name))
+
+    def test_listed_fields_replace_earlier_fields(self):
+        self.client.list_volume_issues([77], [],
+                                       ['id', 'issue_number', 'volume'])
+        summaries = self.client.find_issue_summaries([1])
+
+        self.assertEqual([(u'Issue 1', [u'http://example.com/1.jpg'])],
+                         [(summary.name, summary.image_urls)
+                          for summary in summaries])
@@ -0,0 +1,111 @@
+"""
+Unit tests for the index module.
+"""
+from collections import namedtuple
+import unittest
+
+from index import (get_compact_name, get_name_tokens,
+                   get_trigram_containment, get_trigrams, TrigramIndex,
+                   VolumeIndex)
+
+MockVolume = namedtuple('MockVolume', ['id', 'name'])
+
+
+class TestVolumeIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = VolumeIndex()
+        self.index.add(MockVolume(1, u'Dogville'))
+        self.index.add(MockVolume(2, u'Dogville: Awakening'))
+        self.index.add(MockVolume(3, u'All-New Dogville'))
+
+    def test_get_name_tokens(self):
+        self.assertEqual([u'all', u'new', u'dogville'],
+                         get_name_tokens(u'All-New Dogville'))
+        self.assertEqual([], get_name_tokens(None))
+
+    def test_get(self):
+        self.assertEqual(MockVolume(2, u'Dogville: Awakening'),
+                         self.index.get(2))
+        self.assertEqual(None, self.index.get(4))
+
+    def test_search(self):
+        volumes, confident = self.index.search([u'dogville'], 10)
+        self.assertEqual([1, 2, 3], [volume.id for volume in volumes])
+        self.assertEqual(True, confident)
+
+    def test_search_all_tokens(self):
+        volumes, confident = self.index.search([u'awakening', u'dogville'], 10)
+        self.assertEqual([2], [volume.id for volume in volumes])
+        self.assertEqual(True, confident)
+
+        volumes, confident = self.index.search([u'all-new', u'dogville'], 10)
+        self.assertEqual([3], [volume.id for volume in volumes])
+
+    def test_search_not_confident(self):
+        volumes, confident = self.index.search([u'awakening'], 10)
+        self.assertEqual([2], [volume.id for volume in volumes])
+        self.assertEqual(False, confident)
+
+        self.assertEqual(([], False), self.index.search([u'catville'], 10))
+        self.assertEqual(([], False), self.index.search([], 10))
+
+    def test_search_limit(self):
+        volumes, confident = self.index.search([u'dogville'], 1)
+        self.assertEqual([1], [volume.id for volume in volumes])
+
+    def test_add_replaces(self):
+        self.index.add(MockVolume(1, u'Catville'))
+        volumes, confident = self.index.search([u'dogville'], 10)
+        self.assertEqual([2, 3], [volume.id for volume in volumes])
+        self.assertEqual(False, confident)
+        self.assertEqual(3, len(self.index))
+
+    def test_search_similar(self):
+        self.assertEqual([3], [volume.id for volume in
+                               self.index.search_similar([u'allnew',
+                                                          u'dogville'],
+                                                         10, 0.9)])
+        self.assertEqual([], self.index.search_similar([u'catville'], 10, 0.9))
+
+
+class TestTrigramIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = TrigramIndex()
+        self.index.add(MockVolume(1, u'A-Force'))
+        self.index.add(MockVolume(2, u'All-New Inhumans'))
+        self.index.add(MockVolume(3, u'Inhumans'))
+
+    def test_get_compact_name(self):
+        self.assertEqual(u'aforce', get_compact_name(u'A-Force'))
+        self.assertEqual(u'68badsign', get_compact_name(u"'68: Bad Sign"))
+
+    def test_get_trigrams(self):
+        self.assertEqual(set([u'dog', u'ogs']), get_trigrams(u'dogs'))
+        self.assertEqual(set([u'x']), get_trigrams(u'x'))
+        self.assertEqual(set(), get_trigrams(u''))
+
+    def test_get_trigram_containment(self):
+        self.assertEqual(1.0, get_trigram_containment(get_trigrams(u'dog'),
+                                                      get_trigrams(u'dogs')))
+        self.assertEqual(0.5, get_trigram_containment(get_trigrams(u'dogs'),
+                                                      get_trigrams(u'dog')))
+        self.assertEqual(0.0, get_trigram_containment(set(), set([u'dog'])))
+
+    def test_search(self):
+        matches = self.index.search(u'a force', 10)
+        self.assertEqual([(1.0, 1)], [(similarity, volume.id)
+                                      for (similarity, volume) in matches])
+
+    def test_search_ranks_by_similarity(self):
+        matches = self.index.search(u'inhumans', 10, 0.5)
+        self.assertEqual([3, 2], [volume.id for (_, volume) in matches])
+        matches = self.index.search(u'all new inhumans', 1)
+        self.assertEqual([2], [volume.id for (_, volume) in matches])
+
+    def test_search_misspelt(self):
+        matches = self.index.search(u'inhumanz', 10, 0.5)
+        self.assertEqual(3, matches[0][1].id)
+
+    def test_remove(self):
+        self.index.remove(1)
+        self.assertEqual([], self.index.search(u'a force', 10))
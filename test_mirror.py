@@ -0,0 +1,163 @@
+"""
+Unit tests for the mirror module.
+"""
+import datetime
+import unittest
+
+from mirror import ComicvineMirror
+
+
+class TestMirror(unittest.TestCase):
+    def setUp(self):
+        self.mirror = ComicvineMirror(':memory:')
+
+    def tearDown(self):
+        self.mirror.close()
+
+    def test_get_missing(self):
+        self.assertEqual(None, self.mirror.get_volume(1))
+        self.assertEqual(None, self.mirror.get_issue(1))
+
+    def test_store_volume(self):
+        self.mirror.store_volume(mock_volume(1, 'Dogville'))
+        self.assertEqual(mock_volume(1, 'Dogville'),
+                         self.mirror.get_volume(1))
+
+        self.mirror.store_volume(mock_volume(1, 'Dogville Awakening'))
+        self.assertEqual('Dogville Awakening',
+                         self.mirror.get_volume(1)['name'])
+
+    def test_store_issue(self):
+        issue = mock_issue(10, 1, '2')
+        self.mirror.store_issue(issue)
+        self.assertEqual(issue, self.mirror.get_issue(10))
+
+    def test_unrecognised_date_is_dropped(self):
+        issue = mock_issue(10, 1, '2')
+        issue['date'] = '2000-01'
+        self.mirror.store_issue(issue)
+        self.assertEqual(None, self.mirror.get_issue(10)['date'])
+
+    def test_issue_summary_keeps_details(self):
+        self.mirror.store_issue(mock_issue(10, 1, '2'))
+        self.mirror.store_issue(mock_issue(10, 1, '2', name='Renamed',
+                                           has_details=False))
+
+        issue = self.mirror.get_issue(10)
+        self.assertEqual('Renamed', issue['name'])
+        self.assertEqual(True, issue['has_details'])
+        self.assertEqual('the barkening', issue['description'])
+        self.assertEqual(['Rex', 'Fido'], issue['author_names'])
+
+    def test_get_issue_without_details(self):
+        self.mirror.store_issue(mock_issue(10, 1, '2', has_details=False))
+        self.assertEqual(None, self.mirror.get_issue(10))
+        self.assertEqual(10, self.mirror.get_issue(10, details=False)['id'])
+
+    def test_search_volumes(self):
+        self.mirror.store_volume_issues(mock_volume(1, 'Dogville'), [])
+        self.mirror.store_volume_issues(mock_volume(2, 'Dogville Awakening'),
+                                        [])
+        self.mirror.store_volume_issues(mock_volume(3, 'Dogville 100%'), [])
+        self.mirror.store_volume_issues(mock_volume(4, 'Dog-Ville'), [])
+        self.mirror.store_volume_issues(mock_volume(5, 'Dogville'), [])
+
+        self.assertEqual([], self.mirror.search_volumes([], 10))
+        self.assertEqual([1, 5], volume_ids(
+            self.mirror.search_volumes(['dogville'], 10)))
+        self.assertEqual([2], volume_ids(
+            self.mirror.search_volumes(['awakening', 'dogville'], 10)))
+        self.assertEqual([1], volume_ids(
+            self.mirror.search_volumes(['dogville'], 1)))
+        self.assertEqual([3], volume_ids(
+            self.mirror.search_volumes(['Dogville', '100%'], 10)))
+        self.assertEqual([4], volume_ids(
+            self.mirror.search_volumes(['dog-ville'], 10)))
+
+    def test_search_volumes_only_crawled(self):
+        # e.g. stored from the results of an earlier search
+        self.mirror.store_volume(mock_volume(1, 'Batman'))
+        self.mirror.store_volume_issues(mock_volume(2, 'Superman/Batman'),
+                                        [])
+        self.assertEqual([], self.mirror.search_volumes(['batman'], 10))
+
+        self.mirror.store_volume_issues(mock_volume(1, 'Batman'), [])
+        self.assertEqual([1], volume_ids(
+            self.mirror.search_volumes(['batman'], 10)))
+
+    def test_find_issue_ids(self):
+        self.mirror.store_volume_issues(mock_volume(1, 'Dogville'),
+                                        [mock_issue(10, 1, '1'),
+                                         mock_issue(11, 1, '2')])
+        self.mirror.store_volume(mock_volume(2, 'Dogville Awakening'))
+        self.mirror.store_issue(mock_issue(20, 2, '2'))
+
+        self.assertEqual(([11], [2]),
+                         self.mirror.find_issue_ids([1, 2], '02'))
+        self.assertEqual(([10, 11], [2]),
+                         self.mirror.find_issue_ids([1, 2], None))
+        self.assertEqual(([], [3]), self.mirror.find_issue_ids([3], '1'))
+
+    def test_volume_issues_complete_is_kept(self):
+        self.mirror.store_volume_issues(mock_volume(1, 'Dogville'),
+                                        [mock_issue(10, 1, '1')])
+        self.mirror.store_volume(mock_volume(1, 'Dogville'))
+        self.assertEqual({1: [(10, '1')]},
+                         self.mirror.get_volume_issue_numbers([1]))
+
+    def test_watermarks(self):
+        self.assertEqual(None, self.mirror.get_watermark('updated'))
+        self.mirror.set_watermark_if_missing('updated', '2016-01-01')
+        self.mirror.set_watermark_if_missing('updated', '2017-01-01')
+        self.assertEqual('2016-01-01', self.mirror.get_watermark('updated'))
+
+    def test_store_sync(self):
+        self.mirror.store_volume_issues(mock_volume(1, 'Dogville'),
+                                        [mock_issue(10, 1, '1')])
+        self.mirror.store_sync([mock_volume(1, 'Dogville Reborn')],
+                               [mock_issue(11, 1, '2', has_details=False)],
+                               'updated', '2016-01-01')
+
+        self.assertEqual('Dogville Reborn', self.mirror.get_volume(1)['name'])
+        self.assertEqual(([11], []), self.mirror.find_issue_ids([1], '2'))
+        self.assertEqual([10], self.mirror.get_detailed_issue_ids([10, 11]))
+        self.assertEqual([1], self.mirror.get_volume_ids())
+        self.assertEqual([1], self.mirror.get_complete_volume_ids())
+        self.assertEqual('2016-01-01', self.mirror.get_watermark('updated'))
+
+    def test_get_complete_volume_ids(self):
+        self.mirror.store_volume(mock_volume(1, 'Dogville'))
+        self.mirror.store_volume_issues(mock_volume(2, 'Catville'),
+                                        [mock_issue(20, 2, '1')])
+        self.assertEqual([1, 2], self.mirror.get_volume_ids())
+        self.assertEqual([2], self.mirror.get_complete_volume_ids())
+
+
+def volume_ids(records):
+    return [record['id'] for record in records]
+
+
+def mock_volume(volume_id, name):
+    return {
+        'id': volume_id,
+        'name': name,
+        'start_year': 2000,
+        'publisher_name': 'Dog Comics',
+    }
+
+
+def mock_issue(issue_id, volume_id, issue_number, name='Good Dog',
+               has_details=True):
+    return {
+        'id': issue_id,
+        'name': name,
+        'issue_number': issue_number,
+        'has_details': has_details,
+        'description': 'the barkening' if has_details else None,
+        'author_names': ['Rex', 'Fido'] if has_details else [],
+        'volume_id': volume_id,
+        'volume_name': 'Dogville',
+        'publisher_name': 'Dog Comics',
+        'image_urls': ['http://example.com/dog.jpg'],
+        'date': datetime.datetime(2000, 1, 2),
+    }
@@ -0,0 +1,83 @@
+"""
+Unit tests for the pack module.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from pack import CachePack, get_pack_key, PackError, write_pack
+
+
+class Dog(object):
+    pass
+
+
+class TestPack(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.pack')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_pack_key(self):
+        self.assertEqual(32, len(get_pack_key('lookup_issue', 'abc')))
+        self.assertNotEqual(get_pack_key('lookup_issue', 'abc'),
+                            get_pack_key('lookup_volume', 'abc'))
+
+    def test_write_and_get(self):
+        entries = [(get_pack_key('dogs', str(i)), None, {'id': i})
+                   for i in range(100)]
+        self.assertEqual(100, write_pack(self.path, entries))
+
+        pack = CachePack(self.path)
+        self.assertEqual(100, len(pack))
+        for i in range(100):
+            self.assertEqual((True, {'id': i}),
+                             pack.get(get_pack_key('dogs', str(i))))
+        self.assertEqual((False, None), pack.get(get_pack_key('cats', '1')))
+        pack.close()
+
+    def test_first_entry_wins(self):
+        key = get_pack_key('dogs', '1')
+        write_pack(self.path, [(key, None, 'rex'), (key, None, 'fido')])
+        pack = CachePack(self.path)
+        self.assertEqual((True, 'rex'), pack.get(key))
+        pack.close()
+
+    def test_expired(self):
+        expired_key = get_pack_key('dogs', '1')
+        fresh_key = get_pack_key('dogs', '2')
+        write_pack(self.path, [(expired_key, time.time() - 1, 'rex'),
+                               (fresh_key, time.time() + 3600, 'fido')])
+        pack = CachePack(self.path)
+        self.assertEqual((False, None), pack.get(expired_key))
+        self.assertEqual((True, 'fido'), pack.get(fresh_key))
+        pack.close()
+
+    def test_unrestorable_record(self):
+        key = get_pack_key('dogs', '1')
+        write_pack(self.path, [(key, None, Dog())])
+        pack = CachePack(self.path)
+        module = sys.modules[__name__]
+        dog_class = module.Dog
+        del module.Dog
+        try:
+            self.assertEqual((False, None), pack.get(key))
+        finally:
+            module.Dog = dog_class
+            pack.close()
+
+    def test_empty(self):
+        write_pack(self.path, [])
+        pack = CachePack(self.path)
+        self.assertEqual((False, None), pack.get(get_pack_key('dogs', '1')))
+        pack.close()
+
+    def test_not_a_pack(self):
+        with open(self.path, 'wb') as pack_file:
+            pack_file.write('not a pack at all')
+        self.assertRaises(PackError, CachePack, self.path)
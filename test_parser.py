@@ -2,10 +2,16 @@
 Unit tests for the parser module.
 """
 
+import random
 import unittest
 
 import parser
 
+# characters and fragments of titles for the differential fuzz test
+FUZZ_FRAGMENTS = ['0', '1', '00', '9', '#', "'", '(', ')', ':', '.', 'a.',
+                  'b.c.', ' ', '  ', '\t', '\n', '_', '___', 'v', 'vol', 'v ',
+                  'of ', '(of ', 'OS', 'TPB', 'c2c', '\xbd', 'Dog', '-']
+
 
 class TestParser(unittest.TestCase):
     def test_get_issue_number(self):
@@ -35,6 +41,36 @@ class TestParser(unittest.TestCase):
         self.assertEqual(expected_issue_number,
                          parser.get_issue_number(input_title))
 
+    def test_normalised_issue_number(self):
+        self.assertEqual(None, parser.normalised_issue_number(None))
+        self.assertEqual('1', parser.normalised_issue_number('1'))
+        self.assertEqual('1', parser.normalised_issue_number('001'))
+        self.assertEqual('0', parser.normalised_issue_number('000'))
+        self.assertEqual('0.5', parser.normalised_issue_number('0.5'))
+        self.assertEqual('3.1', parser.normalised_issue_number('003.1'))
+        self.assertEqual('1\xbd', parser.normalised_issue_number('01\xbd'))
+        self.assertEqual('\xbd', parser.normalised_issue_number('\xbd'))
+        self.assertEqual('', parser.normalised_issue_number(''))
+
+    def test_find_indexed_issue_ids(self):
+        index = {2: [(20, '1')], 1: [(10, '01'), (11, '2')]}
+        self.assertEqual([10, 20], parser.find_indexed_issue_ids(index, '1'))
+        self.assertEqual([11], parser.find_indexed_issue_ids(index, '002'))
+        self.assertEqual([10, 11, 20],
+                         parser.find_indexed_issue_ids(index, None))
+        self.assertEqual([], parser.find_indexed_issue_ids(index, '3'))
+
+    def test_get_following_issue_ids(self):
+        issues = [(13, '3'), (10, '0'), (11, '1'), (14, '1\xbd'), (12, '2'),
+                  (15, 'Annual')]
+        self.assertEqual([14, 12],
+                         parser.get_following_issue_ids(issues, '01', 2))
+        self.assertEqual([13], parser.get_following_issue_ids(issues, '2', 5))
+        self.assertEqual([], parser.get_following_issue_ids(issues, '3', 5))
+        self.assertEqual([],
+                         parser.get_following_issue_ids(issues, 'Annual', 5))
+        self.assertEqual([], parser.get_following_issue_ids(issues, None, 5))
+
     def test_get_title_tokens(self):
         self.run_get_title_tokens_test('', '')
         self.run_get_title_tokens_test('superdog in space',
@@ -107,6 +143,82 @@ class TestParser(unittest.TestCase):
         self.assertEqual('1 3 4 5', parser.rreplace('1232425', '2', ' ', 4))
         self.assertEqual('1232425', parser.rreplace('1232425', '2', ' ', 0))
 
+    def test_parse_title(self):
+        tokenizer = counting_tokenizer()
+        parsed = parser.parse_title('Dogville #2 (2014)', tokenizer)
+        self.assertEqual(
+            parser.ParsedTitle(issue_number='2', title_tokens=('dogville',),
+                               year='2014'),
+            parsed)
+        self.assertIs(parsed,
+                      parser.parse_title('Dogville #2 (2014)', tokenizer))
+        self.assertEqual(1, tokenizer.calls)
+
+        # a different tokenizer, or none, is parsed separately
+        self.assertEqual((), parser.parse_title('Dogville #2 (2014)')
+                         .title_tokens)
+
+    def test_get_title_tokens_returns_a_new_list(self):
+        tokenizer = counting_tokenizer()
+        title_tokens = parser.get_title_tokens('Dogville #2', tokenizer)
+        title_tokens.append('changed')
+        self.assertEqual(['dogville'],
+                         parser.get_title_tokens('Dogville #2', tokenizer))
+
+    def test_parse_cache(self):
+        cache = parser.ParseCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(2, cache.get('b'))
+        cache.put('c', 3)
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        cache.clear()
+        self.assertEqual(None, cache.get('c'))
+
+    def test_parse_normalised_title_matches_regex(self):
+        titles = [
+            'Magnus, Robot Fighter 01 (2010) (two covers) (Minutemen-DTs)',
+            'Spider-Man 003.1 (2010) (extra stuff)',
+            'Buffy Season 10 015 (2015) (Digital) (Cypher 2.0-Empire)',
+            '100 Bullets v02 - Split Second Chance (2001) (Zone-Empire)',
+            "'68 Bad Sign OS (2015)",
+            'Superman # 01\xbd',
+            'S.H.I.E.L.D. 003 (of 4)',
+            'Dogville ___5___ and ___6___',
+        ]
+        fuzz = random.Random(0)
+        for _ in range(5000):
+            titles.append(''.join(fuzz.choice(FUZZ_FRAGMENTS)
+                                  for _ in range(fuzz.randint(0, 12))))
+
+        def tokenizer(title):
+            return [title]
+
+        for title in titles:
+            for variant in (title, title.decode('latin-1')):
+                self.assertEqual(
+                    parser.parse_normalised_title_regex(variant, tokenizer),
+                    parser.parse_normalised_title(variant, tokenizer),
+                    'parsed differently: %r' % variant)
+
+    def test_parse_normalised_title_is_linear(self):
+        # the regex parser takes seconds on these
+        self.assertEqual(('2', []),
+                         parser.parse_normalised_title('x' * 20000 + '1 2'))
+        self.assertEqual((None, []),
+                         parser.parse_normalised_title('(' * 20000))
+
+
+def counting_tokenizer():
+    def get_title_tokens(title):
+        get_title_tokens.calls += 1
+        return title.split()
+
+    get_title_tokens.calls = 0
+    return get_title_tokens
+
 
 def mock_tokenizer(expected_title, title_tokens):
     def get_title_tokens(title):
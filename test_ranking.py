@@ -3,7 +3,8 @@ Unit tests for the ranking module.
 """
 import unittest
 
-from ranking import IssueScorer
+from ranking import (best_results, IssueScorer, keygen, QueryContext,
+                     score_collection, score_results, TopResults)
 
 
 class TestRanking(unittest.TestCase):
@@ -164,6 +165,20 @@ class TestRanking(unittest.TestCase):
         # TODO - ignore sentences with "Containing" which don't have numbers
         # self.assertEqual(0, run_score_comments('Containing references to dogs'))
 
+    def test_score_collection(self):
+        self.assertEqual(0, score_collection(None))
+        self.assertEqual(20, score_collection('Dogs\nCOLLECTS ISSUES #1-10'))
+        self.assertEqual(20, score_collection('Collects #1-10\n'
+                                              'and collecting issues #11-20'))
+        self.assertEqual(10, score_collection('Dogs.\nCollecting #1-10'))
+        self.assertEqual(0, score_collection('CollectS #1-10'))
+        self.assertEqual(10, score_collection('Collects the Translates'))
+
+    def test_score_comments_uses_collection_score(self):
+        metadata = mock_metadata(comments='this collects issues #1-10')
+        metadata.collection_score = 0
+        self.assertEqual(0, IssueScorer(metadata=metadata).score_comments())
+
     def test_score_publish_date(self):
         # missing publish date in metadata
         self.assertEqual(10, run_score_publish_date('Dogville #2', None))
@@ -228,6 +243,130 @@ class TestRanking(unittest.TestCase):
         self.assertEqual(0,
                          run_score_title_tokens('  Dogville  ', ['dogville']))
 
+        # matching despite punctuation and spacing
+        self.assertEqual(0,
+                         run_score_title_tokens('All-New Dogville',
+                                                ['allnew', 'dogville']))
+        self.assertEqual(0,
+                         run_score_title_tokens('Dog Ville', ['dogville']))
+
+        # misspelt tokens partly match
+        self.assertEqual(2,
+                         run_score_title_tokens('Dogville', ['dogvile']))
+
+    def test_query_context(self):
+        query = QueryContext(title='Dogville #02 (2010)',
+                             tokenizer=mock_tokens_function(['Dog', 'Ville']),
+                             authors=['Rex', 'Fido'])
+        self.assertEqual(['dog', 'ville'], query.title_tokens)
+        self.assertEqual('dog ville', query.sanitized_title)
+        self.assertEqual('2', query.issue_number)
+        self.assertEqual(2.0, query.issue_value)
+        self.assertEqual(2010, query.year)
+        self.assertEqual(set(['Rex', 'Fido']), query.authors)
+
+        query = QueryContext(title='Dogville #2b',
+                             tokenizer=mock_tokens_function(['dogville']))
+        self.assertEqual(None, query.issue_value)
+        self.assertEqual(None, query.year)
+        self.assertEqual(50, IssueScorer(metadata=mock_metadata('Dogville', 1),
+                                         query=query).score_issue_number())
+
+    def test_keygen_with_query_context(self):
+        tokenizer = mock_tokens_function(['dogville', 'awakening'])
+        query = QueryContext(title='Dogville Awakening #2 (2014)',
+                             tokenizer=tokenizer)
+        for metadata in [mock_metadata('Dogville', 2.0, mock_date(2010)),
+                         mock_metadata('Dogville Awakening', 2.0),
+                         mock_metadata('Dogville Awakening', 5.0, None)]:
+            self.assertEqual(
+                keygen(metadata, title='Dogville Awakening #2 (2014)',
+                       title_tokens_function=tokenizer),
+                keygen(metadata, query=query))
+
+    def test_score_results(self):
+        results = []
+        for series in ['Dogville', 'Dogville Awakening', 'Catville']:
+            for series_index in [1.0, 2.0]:
+                for publish_date in [None, mock_date(2010), mock_date(2014)]:
+                    for comments in ['', 'Collects issues #1-10']:
+                        results.append(mock_metadata(series, series_index,
+                                                     publish_date, comments))
+        for title in [None, 'Dogville #2', 'Dogville Awakening #1 (2014)',
+                      'Dogville']:
+            tokenizer = mock_tokens_function(
+                [] if title is None else title.split(' #')[0].split())
+            query = QueryContext(title=title, tokenizer=tokenizer)
+            scores = [keygen(metadata, title=title,
+                             title_tokens_function=tokenizer)
+                      for metadata in results]
+            self.assertEqual(scores, score_results(results, query))
+            ranked = sorted(range(len(results)), key=scores.__getitem__)
+            self.assertEqual([results[index] for index in ranked[:5]],
+                             best_results(results, query, 5))
+
+    def test_top_results(self):
+        query = QueryContext(title='Dogville #2',
+                             tokenizer=mock_tokens_function(['dogville']))
+        results = [mock_metadata('Dogville', 5.0),
+                   mock_metadata('Dogville', 2.0, None),
+                   mock_metadata('Dogville Awakening', 2.0),
+                   mock_metadata('Dogville', 7.0),
+                   mock_metadata('Dogville', 2.0)]
+        ranked = sorted(results, key=lambda result: keygen(result,
+                                                           query=query))
+
+        top = TopResults(query)
+        for result in results:
+            top.add(result)
+        self.assertEqual(ranked, top.results())
+        self.assertFalse(top.is_done())
+
+        top = TopResults(query, limit=2)
+        for result in results:
+            top.add(result)
+        self.assertEqual(ranked[:2], top.results())
+
+    def test_top_results_stop_score(self):
+        query = QueryContext(title='Dogville #2',
+                             tokenizer=mock_tokens_function(['dogville']))
+        top = TopResults(query, stop_score=0)
+        self.assertFalse(top.is_done())
+        self.assertEqual(50, top.add(mock_metadata('Dogville', 5.0)))
+        self.assertFalse(top.is_done())
+        self.assertEqual(0, top.add(mock_metadata('Dogville', 2.0)))
+        self.assertTrue(top.is_done())
+
+        top = TopResults(query, limit=2, stop_score=0)
+        top.add(mock_metadata('Dogville', 2.0))
+        self.assertFalse(top.is_done())
+        top.add(mock_metadata('Dogville', 2.0))
+        self.assertTrue(top.is_done())
+
+    def test_top_results_confident_score(self):
+        query = QueryContext(title='Dogville #2',
+                             tokenizer=mock_tokens_function(['dogville']))
+        collection = mock_metadata('Dogville', 2.0,
+                                   comments='Collects issues #1-10')
+
+        top = TopResults(query, stop_score=0)
+        self.assertEqual(20, top.add(collection))
+        self.assertFalse(top.is_done())
+
+        top = TopResults(query, stop_score=0, confident_score=0)
+        top.add(mock_metadata('Dogville', 3.0))
+        self.assertFalse(top.is_done())
+        top.add(collection)
+        self.assertTrue(top.is_done())
+
+        top = TopResults(query, confident_score=0)
+        top.add(mock_metadata('Dogville', 2.0, None))
+        self.assertFalse(top.is_done())
+
+        top = TopResults(QueryContext(), confident_score=0)
+        top.add(mock_metadata('Dogville', 2.0))
+        self.assertFalse(top.is_done())
+
 
 def run_score_comments(comments):
     scorer = IssueScorer(metadata=mock_metadata(comments=comments))
@@ -0,0 +1,20 @@
+"""
+Unit tests for the utils module.
+"""
+import unittest
+
+from utils import get_identify_query
+
+
+class TestIdentifyQuery(unittest.TestCase):
+    def test_get_identify_query(self):
+        query = get_identify_query(['dogville'], u'2', 1999,
+                                   [u'Rex', u'Fido'],
+                                   {'isbn': 12, 'comicvine': u'3'})
+        self.assertEqual(((u'dogville',), u'2', 1999, (u'Fido', u'Rex'),
+                          ((u'comicvine', u'3'), (u'isbn', u'12'))), query)
+
+    def test_non_ascii_identifier(self):
+        query = get_identify_query([u'caf\xe9'], None, None, None,
+                                   {u'title': u'Caf\xe9'})
+        self.assertEqual(((u'title', u'Caf\xe9'),), query[4])
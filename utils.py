@@ -4,12 +4,29 @@ calibre_plugins.comicvine - A calibre metadata source for comicvine
 
 from calibre.ebooks.metadata.book.base import Metadata
 
-from client import PyComicvineWrapper
+from client import get_client, ResultCache
+from config import PREFS
+
+# ranked issue IDs from earlier identify calls, keyed by normalised query
+_identify_results = ResultCache('identify', hours=PREFS['cache_hours'])
 
 
 def build_meta(log, issue_id):
     """Build metadata record based on comicvine issue_id."""
-    issue = PyComicvineWrapper(log).lookup_issue(issue_id)
+    return issue_to_meta(get_client(log).lookup_issue(issue_id))
+
+
+def build_summary_metas(log, issue_ids):
+    """
+    Build metadata records for ranking, without comments or credits, for
+    the comicvine issue_ids found.
+    """
+    return [issue_to_meta(issue) for issue in
+            get_client(log).find_issue_summaries(issue_ids)]
+
+
+def issue_to_meta(issue):
+    """Build metadata record from a client Issue, if any."""
     if issue:
         meta = Metadata(issue.get_full_title(), issue.get_authors())
         meta.series = issue.volume_name
@@ -17,6 +34,7 @@ def build_meta(log, issue_id):
         meta.set_identifier('comicvine', str(issue.id))
         meta.set_identifier('comicvine-volume', str(issue.volume_id))
         meta.comments = issue.description
+        meta.collection_score = issue.get_collection_score()
         meta.has_cover = False
         meta.publisher = issue.publisher_name
         meta.pubdate = issue.date
@@ -28,13 +46,61 @@ def build_meta(log, issue_id):
 def find_volumes(title_tokens, log, volume_id=None):
     """Find the volume IDs of candidate volumes that match the title string."""
     if volume_id:
-        result = PyComicvineWrapper(log).lookup_volume(int(volume_id))
+        result = get_client(log).lookup_volume(int(volume_id))
         return [result] if result is not None else []
     else:
-        return PyComicvineWrapper(log).search_for_volumes(title_tokens)
+        return get_client(log).search_for_volumes(title_tokens)
 
 
 def find_issue_ids(candidate_volume_ids, issue_number, log):
     """Find issue IDs in candidate volumes that match the issue_number."""
-    return PyComicvineWrapper(log).search_for_issue_ids(candidate_volume_ids,
-                                                        issue_number)
+    return get_client(log).search_for_issue_ids(candidate_volume_ids,
+                                                issue_number)
+
+
+def find_volume_issue_numbers(volume_ids, log):
+    """
+    Find the (issue ID, issue number) pairs of every issue in each volume.
+    """
+    return get_client(log).find_volume_issue_numbers(volume_ids)
+
+
+def get_identify_query(title_tokens, issue_number, year, authors, identifiers):
+    """
+    Build a normalised, hashable key for an identify query.
+    """
+    return (tuple(title_tokens),
+            issue_number,
+            year,
+            tuple(sorted(authors or [])),
+            tuple(sorted((key, unicode(value))
+                         for key, value in (identifiers or {}).items())))
+
+
+def find_cached_issue_ids(query):
+    """
+    Return the ranked issue IDs cached for the identify query, or None.
+    """
+    return _identify_results.get(query)
+
+
+def cache_issue_ids(query, issue_ids, client_calls, log):
+    """
+    Cache the ranked issue IDs for the identify query.
+
+    The entry expires with the earliest of the cached client calls it was
+    derived from, given as (method name, args) pairs.
+    """
+    client = get_client(log)
+    expirations = []
+    for method_name, args in client_calls:
+        try:
+            expiration = client.get_cache_expiration(method_name, *args)
+        except KeyError:
+            log.debug('Not caching identify result, %s%r is not cached' %
+                      (method_name, args))
+            return
+        if expiration is not None:
+            expirations.append(expiration)
+    _identify_results.put(query, issue_ids,
+                          min(expirations) if expirations else None)